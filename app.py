@@ -6,7 +6,9 @@ import datetime
 import qrcode
 from io import BytesIO
 import base64
+import threading
 from flask_socketio import SocketIO
+from ticket_store import COMPACT_EVERY, ScanJournal, journal_path_for
 
 app = Flask(__name__)
 app.secret_key = uuid.uuid4().hex
@@ -17,12 +19,85 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 EXCEL_PATH = None
+tickets_df = None
+ticket_index = {}
+# Check-ins are journalled as they happen and written into the Excel file
+# in the background every COMPACT_EVERY scans, not rewritten per scan
+journal = None
+pending_scans = 0
+saving = False
+tickets_lock = threading.Lock()
+# Held while the Excel file itself is being written
+excel_lock = threading.Lock()
 stats = {
     'scanned': 0,
     'valid': 0,
     'invalid': 0
 }
 
+def load_tickets(fresh=False):
+    """Read EXCEL_PATH and replay check-ins journalled since its last save
+
+    ``fresh`` drops the journal instead, for a newly uploaded file.
+    """
+    global tickets_df, journal, pending_scans
+    with tickets_lock:
+        if journal is not None:
+            journal.close()
+        journal = ScanJournal(journal_path_for(EXCEL_PATH))
+        if fresh:
+            journal.truncate()
+        tickets_df = pd.read_excel(EXCEL_PATH)
+        rebuild_index()
+        pending_scans = 0
+        for ticket_id, scan_time in journal.replay():
+            row_idx = ticket_index.get(ticket_id)
+            if row_idx is not None:
+                mark_scanned(row_idx, scan_time)
+                pending_scans += 1
+
+def mark_scanned(row_idx, scan_time):
+    if 'scanned' not in tickets_df.columns:
+        tickets_df['scanned'] = False
+    if 'scan_time' not in tickets_df.columns:
+        tickets_df['scan_time'] = None
+    tickets_df.at[row_idx, 'scanned'] = True
+    tickets_df.at[row_idx, 'scan_time'] = scan_time
+
+def save_in_background():
+    """Start writing the tickets to the Excel file; call with tickets_lock held"""
+    global pending_scans, saving
+    if saving:
+        return
+    if journal.rotate():
+        pending_scans = 0
+    saving = True
+    threading.Thread(target=save_tickets, args=(tickets_df.copy(), EXCEL_PATH, journal), daemon=True).start()
+
+def save_tickets(df, path, scan_journal):
+    global saving
+    try:
+        with excel_lock:
+            # A new file was uploaded since this save started
+            if scan_journal is not journal:
+                return
+            temp_path = path + '.saving.xlsx'
+            df.to_excel(temp_path, index=False)
+            os.replace(temp_path, path)
+            scan_journal.discard_rotated()
+    except Exception as e:
+        # The rotated journal is kept, so the next save retries
+        print(f"Saving tickets failed: {e}")
+    finally:
+        with tickets_lock:
+            saving = False
+
+def rebuild_index():
+    global ticket_index
+    ticket_index = {}
+    if tickets_df is not None and 'uuid' in tickets_df.columns:
+        ticket_index = {str(ticket_id): idx for idx, ticket_id in tickets_df['uuid'].items()}
+
 @app.route('/')
 def index():
     if not session.get('logged_in'):
@@ -87,9 +162,11 @@ def upload_excel():
     
     if file and file.filename.endswith('.xlsx'):
         filename = os.path.join(UPLOAD_FOLDER, 'tickets.xlsx')
-        file.save(filename)
         global EXCEL_PATH
-        EXCEL_PATH = filename
+        with excel_lock:
+            file.save(filename)
+            EXCEL_PATH = filename
+            load_tickets(fresh=True)
         return jsonify({'success': True, 'message': 'File uploaded successfully'})
     
     return jsonify({'success': False, 'message': 'Invalid file format'})
@@ -99,9 +176,9 @@ def verify():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global EXCEL_PATH, stats
+    global EXCEL_PATH, stats, tickets_df, pending_scans
     
-    if not EXCEL_PATH:
+    if not EXCEL_PATH or tickets_df is None:
         return jsonify({'success': False, 'message': 'No Excel file uploaded'})
     
     ticket_id = request.json.get('ticket_id')
@@ -110,15 +187,15 @@ def verify():
         return jsonify({'success': False, 'message': 'No ticket ID provided'})
     
     try:
-        df = pd.read_excel(EXCEL_PATH)
+        df = tickets_df
         
         if 'uuid' not in df.columns:
             return jsonify({'success': False, 'message': 'UUID column not found in Excel'})
         
         stats['scanned'] += 1
         
-        if ticket_id in df['uuid'].values:
-            row_idx = df[df['uuid'] == ticket_id].index[0]
+        row_idx = ticket_index.get(ticket_id)
+        if row_idx is not None:
             
             if 'scanned' in df.columns and df.at[row_idx, 'scanned'] == True:
                 return jsonify({
@@ -134,16 +211,13 @@ def verify():
                     }
                 })
             
-            if 'scanned' not in df.columns:
-                df['scanned'] = False
-            if 'scan_time' not in df.columns:
-                df['scan_time'] = None
-            
-            df.at[row_idx, 'scanned'] = True
             current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            df.at[row_idx, 'scan_time'] = current_time
-            
-            df.to_excel(EXCEL_PATH, index=False)
+            with tickets_lock:
+                mark_scanned(row_idx, current_time)
+                journal.append(ticket_id, current_time)
+                pending_scans += 1
+                if pending_scans >= COMPACT_EVERY:
+                    save_in_background()
             
             stats['valid'] += 1
             socketio.emit('stats_update', stats)
@@ -181,13 +255,13 @@ def generate_tickets():
     if not session.get('logged_in') or not session.get('is_admin'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global EXCEL_PATH
+    global EXCEL_PATH, tickets_df
     
-    if not EXCEL_PATH:
+    if not EXCEL_PATH or tickets_df is None:
         return jsonify({'success': False, 'message': 'No Excel file uploaded'})
     
     try:
-        df = pd.read_excel(EXCEL_PATH)
+        df = tickets_df
         
         if 'uuid' not in df.columns:
             df['uuid'] = [str(uuid.uuid4()) for _ in range(len(df))]
@@ -212,7 +286,9 @@ def generate_tickets():
                 'name': row['name'] if 'name' in df.columns else f"Attendee {idx+1}"
             })
         
-        df.to_excel(EXCEL_PATH, index=False)
+        with excel_lock:
+            df.to_excel(EXCEL_PATH, index=False)
+        rebuild_index()
         
         return jsonify({'success': True, 'message': 'Tickets generated', 'qr_codes': qr_codes})
     
@@ -224,11 +300,11 @@ def get_stats():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global stats, EXCEL_PATH
+    global stats, tickets_df
     
-    if EXCEL_PATH:
+    if tickets_df is not None:
         try:
-            df = pd.read_excel(EXCEL_PATH)
+            df = tickets_df
             if 'scanned' in df.columns:
                 stats['valid'] = df['scanned'].sum()
                 stats['scanned'] = stats['valid'] + stats['invalid']
@@ -237,5 +313,10 @@ def get_stats():
     
     return jsonify({'success': True, 'stats': stats})
 
+# Pick up the tickets and journalled check-ins of a previous run
+if os.path.exists(os.path.join(UPLOAD_FOLDER, 'tickets.xlsx')):
+    EXCEL_PATH = os.path.join(UPLOAD_FOLDER, 'tickets.xlsx')
+    load_tickets()
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -1,109 +1,284 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash
-import csv
+# Must come first: gevent mode patches the standard library on import
+from server_mode import ASYNC_MODE, run_blocking, iter_blocking
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, flash, g
 import uuid
 import os
 import datetime
-import qrcode
-from io import BytesIO
-import base64
-from flask_socketio import SocketIO
+import time
+from flask_socketio import SocketIO, join_room
 import json
 import logging
+import atexit
+import tempfile
 from werkzeug.utils import secure_filename
+from ticket_store import open_store, import_ticket_file, db_path_for, SqliteTicketStore
+from bloom import BloomFilter
+from broadcast import BroadcastAggregator
+from events import Event, EventRegistry, valid_event_id, event_room
+from gate_stats import UNASSIGNED
+from ticket_signing import TicketSigner, InvalidTicketCode, is_signed
+from metrics import Counter, Histogram
+import metrics
+import qr_render
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ticket store backend: 'csv' (in-memory + scan journal) or 'sqlite'
+STORE_BACKEND = os.environ.get('TICKET_STORE_BACKEND', 'csv')
+
+# Message queue URL (e.g. redis://localhost:6379/0) shared by several server
+# processes; each process then relays the others' Socket.IO broadcasts
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+if SOCKETIO_MESSAGE_QUEUE and not os.environ.get('SECRET_KEY'):
+    raise RuntimeError('SECRET_KEY must be set when running several server processes')
+if SOCKETIO_MESSAGE_QUEUE and STORE_BACKEND != 'sqlite':
+    raise RuntimeError('Several server processes need TICKET_STORE_BACKEND=sqlite')
+
+# Event used when a session has not picked one; its tickets live directly
+# in the upload folder, other events' in uploads/events/<event id>/
+DEFAULT_EVENT = os.environ.get('EVENT_ID', 'default')
+if not valid_event_id(DEFAULT_EVENT):
+    raise RuntimeError('EVENT_ID may only contain letters, digits, - and _ (at most 64)')
+
+# With a signing key, QR codes carry a signed payload (ticket ID, event ID,
+# ticket type) that /verify checks before touching the ticket store
+TICKET_SIGNING_KEY = os.environ.get('TICKET_SIGNING_KEY')
+# Reject bare ticket IDs (old QR codes and manual entry) as well
+REQUIRE_SIGNED_TICKETS = os.environ.get('REQUIRE_SIGNED_TICKETS') == '1'
+if REQUIRE_SIGNED_TICKETS and not TICKET_SIGNING_KEY:
+    raise RuntimeError('REQUIRE_SIGNED_TICKETS needs TICKET_SIGNING_KEY')
+
 app = Flask(__name__)
-app.secret_key = uuid.uuid4().hex
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Sessions must be readable by every process behind the load balancer
+app.secret_key = os.environ.get('SECRET_KEY') or uuid.uuid4().hex
+# Uploads are streamed to disk and imported row by row, so large lists are fine
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 512)) * 1024 * 1024
 
-# Configure SocketIO for better performance
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# Configure SocketIO for better performance; ASYNC_MODE=gevent serves many
+# concurrent connections from one process
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    message_queue=SOCKETIO_MESSAGE_QUEUE)
 
 UPLOAD_FOLDER = 'uploads'
+EVENTS_FOLDER = os.path.join(UPLOAD_FOLDER, 'events')
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
-CSV_PATH = None
-stats = {
-    'scanned': 0,
-    'valid': 0,
-    'invalid': 0,
-    'total_tickets': 0,
-    'scanned_today': 0,
-    'last_scan_time': None,
-    'scanner_status': 'offline'
-}
-
-# Store recent scans for better monitoring
-recent_scans = []
-MAX_RECENT_SCANS = 50
-
-def read_csv_data():
-    """Read CSV data and return as list of dictionaries"""
-    if not CSV_PATH or not os.path.exists(CSV_PATH):
-        return []
-    
-    try:
-        with open(CSV_PATH, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            return list(reader)
-    except Exception as e:
-        logger.error(f"Error reading CSV: {e}")
-        return []
+if ASYNC_MODE == 'gevent':
+    qr_render.start_workers()
+
+@atexit.register
+def shutdown():
+    """Compact outstanding check-ins and stop the QR rendering pool"""
+    events.close_all()
+    qr_render.shutdown()
+
+# Recent scans kept per event for the dashboards
+MAX_RECENT_SCANS = int(os.environ.get('MAX_RECENT_SCANS', 500))
+
+# Rolling window, in seconds, of the per-gate throughput on the dashboard
+GATE_WINDOW_SECONDS = int(os.environ.get('GATE_WINDOW_SECONDS', 300))
+
+# Scans returned by one /get_recent_scans call
+RECENT_SCANS_PAGE = 20
+
+# Largest number of queued scans accepted by /verify_batch
+MAX_VERIFY_BATCH = 500
 
-def write_csv_data(data):
-    """Write data to CSV file"""
-    if not CSV_PATH:
-        return False
+# Tickets per page of the /tickets listing
+QR_PAGE_SIZE = 50
+MAX_QR_PAGE_SIZE = 500
+
+# Bloom filter of ticket IDs sent to scanners for offline lookups, rebuilt
+# only when the ticket set changes
+TICKET_BLOOM_FP_RATE = 0.001
+
+# Events are loaded on first use and unloaded (their store closed) after
+# this many idle seconds, or least recently used first past the limit
+EVENT_IDLE_SECONDS = int(os.environ.get('EVENT_IDLE_SECONDS', 900))
+MAX_LOADED_EVENTS = int(os.environ.get('MAX_LOADED_EVENTS', 50))
+
+# Per-process metrics served by /metrics
+REQUEST_SECONDS = Histogram('ticket_http_request_seconds', 'HTTP request latency', ['endpoint', 'status'])
+STORE_SECONDS = Histogram('ticket_store_seconds', 'Ticket store call latency', ['operation'])
+QR_RENDER_SECONDS = Histogram('ticket_qr_render_seconds', 'QR code rendering latency', ['operation'])
+SOCKET_EVENT_SECONDS = Histogram('ticket_socket_event_seconds', 'Socket.IO event handling latency', ['event'])
+SCANS = Counter('ticket_scans', 'Scans by event, result, scanner and gate', ['event', 'result', 'scanner', 'gate'])
+
+# Dashboard updates are coalesced and sent at most this many times a second
+BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE', 4))
+
+def event_directory(event_id):
+    if event_id == DEFAULT_EVENT:
+        return UPLOAD_FOLDER
+    return os.path.join(EVENTS_FOLDER, event_id)
+
+def open_event_store(csv_path):
+    """Open the ticket store for an event's CSV, or None before an upload"""
+    if SOCKETIO_MESSAGE_QUEUE:
+        # Another process may be importing the CSV; only attach to its database
+        db_path = db_path_for(csv_path)
+        return run_blocking(SqliteTicketStore, db_path) if os.path.exists(db_path) else None
+    if os.path.exists(csv_path):
+        # Picks up tickets and journalled check-ins left by a previous run
+        return run_blocking(open_store, csv_path, backend=STORE_BACKEND)
+    return None
+
+def create_event(event_id):
+    """Load an event with its store, broadcaster and QR signer"""
+    event = Event(event_id, event_directory(event_id), open_event_store, MAX_RECENT_SCANS, GATE_WINDOW_SECONDS,
+                  blocking=run_blocking)
+    event.broadcaster = BroadcastAggregator(socketio, event.current_stats, interval=1 / BROADCAST_RATE,
+                                            room=event.room)
+    if TICKET_SIGNING_KEY:
+        event.signer = TicketSigner(TICKET_SIGNING_KEY, event_id)
+    return event
+
+events = EventRegistry(create_event, idle_seconds=EVENT_IDLE_SECONDS, max_loaded=MAX_LOADED_EVENTS)
+
+def current_event():
+    """The session's event, kept loaded until the request is torn down"""
+    if 'event' not in g:
+        g.event = events.acquire(session.get('event_id') or DEFAULT_EVENT)
+    return g.event
+
+def ticket_summary(event, row):
+    """Ticket fields listed on the admin page, with the QR image URL
     
-    try:
-        fieldnames = data[0].keys() if data else ['name', 'email', 'uuid', 'scanned', 'scan_time']
-        with open(CSV_PATH, 'w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(data)
-        return True
-    except Exception as e:
-        logger.error(f"Error writing CSV: {e}")
-        return False
+    The URL carries the image's ETag, so a ticket whose payload changes
+    (a new ticket type or signing key) gets a new URL.
+    """
+    payload = qr_payload(event, row)
+    return {
+        'ticket_id': row['uuid'],
+        'name': row.get('name', 'Unknown'),
+        'email': row.get('email', 'N/A'),
+        'qr_payload': payload,
+        'qr_url': url_for('qr_image', ticket_id=row['uuid'], event=event.event_id, v=qr_render.qr_etag(payload))
+    }
+
+def qr_payload(event, row):
+    """Text encoded in a ticket's QR code"""
+    if event.signer is None:
+        return row['uuid']
+    return event.signer.sign(row['uuid'], row.get('ticket_type', ''))
 
-def update_stats():
-    """Update statistics from CSV file"""
-    global stats, CSV_PATH
-    if CSV_PATH and os.path.exists(CSV_PATH):
+def parse_scanned_code(event, code):
+    """Return (ticket_id, rejection message or None) for a scanned code
+    
+    Signed codes are checked cryptographically, so forged and other-event
+    codes are rejected without a ticket store lookup.
+    """
+    if not isinstance(code, str):
+        return str(code), 'Invalid ticket code'
+    if event.signer is not None and is_signed(code):
         try:
-            data = read_csv_data()
-            if data:
-                stats['total_tickets'] = len(data)
-                stats['valid'] = sum(1 for row in data if row.get('scanned') == 'True')
-                stats['scanned'] = stats['valid'] + stats['invalid']
-                
-                # Calculate today's scans
-                today = datetime.datetime.now().date()
-                today_scans = 0
-                for row in data:
-                    scan_time = row.get('scan_time', '')
-                    if scan_time:
-                        try:
-                            scan_date = datetime.datetime.strptime(scan_time, "%Y-%m-%d %H:%M:%S").date()
-                            if scan_date == today:
-                                today_scans += 1
-                        except:
-                            pass
-                stats['scanned_today'] = today_scans
-        except Exception as e:
-            logger.error(f"Error updating stats: {e}")
+            return event.signer.verify(code)[0], None
+        except InvalidTicketCode as e:
+            return code, str(e)
+    if REQUIRE_SIGNED_TICKETS:
+        return code, 'Unsigned ticket code'
+    return code, None
+
+def reject_scan(event, code, reason, scan_time, gate=None, queue_seconds=None, scanner=None):
+    """Record a scan refused before lookup as an invalid ticket"""
+    result = record_scan(event, code, None, False, scan_time, gate, queue_seconds, rejected=True, scanner=scanner)
+    result['message'] = reason
+    return result
 
-def add_recent_scan(scan_data):
-    """Add scan to recent scans list"""
-    global recent_scans
+def add_recent_scan(event, scan_data, gate=None):
+    """Add scan to the event's recent scans feed"""
     scan_data['timestamp'] = datetime.datetime.now().isoformat()
-    recent_scans.insert(0, scan_data)
-    if len(recent_scans) > MAX_RECENT_SCANS:
-        recent_scans.pop()
+    scan_data['gate'] = gate
+    event.recent_scans.add(scan_data)
+
+def parse_gate(value):
+    """Gate name sent by a scanner, or None"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip()[:64]
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    """Record the request latency by endpoint and status code"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint or 'unmatched', response.status_code)
+    return response
+
+@app.before_request
+def select_event():
+    """Switch the session to the event named by ``?event=``"""
+    event_id = request.args.get('event')
+    if event_id is not None:
+        if not valid_event_id(event_id):
+            return jsonify({'success': False, 'message': 'Invalid event ID'}), 400
+        session['event_id'] = event_id
+
+@app.teardown_request
+def release_event(exc):
+    event = g.pop('event', None)
+    if event is not None:
+        events.release(event)
+
+@socketio.on('connect')
+def join_event_room():
+    """Dashboards and scanners only receive their own event's updates"""
+    join_room(event_room(session.get('event_id') or DEFAULT_EVENT))
+
+# Socket.IO session ID -> event of each registered scanner page
+scanner_registrations = {}
+
+def scanners_changed(event):
+    """Tell the event's dashboards how many scanners are connected"""
+    count = event.gates.scanner_count()
+    socketio.emit('scanner_status_update', {'status': 'online' if count else 'offline', 'scanners': count},
+                  to=event.room)
+    event.broadcaster.stats_changed()
+
+@socketio.on('register_scanner')
+def register_scanner(data):
+    """Count a scanner page at its gate until its socket disconnects
+    
+    The scanner's event stays loaded while it is registered.
+    """
+    if not session.get('logged_in'):
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    gate = parse_gate(data.get('gate')) if isinstance(data, dict) else None
+    unregister_scanner()
+    event = events.acquire(session.get('event_id') or DEFAULT_EVENT)
+    scanner_registrations[request.sid] = event
+    event.gates.register(request.sid, gate)
+    scanners_changed(event)
+    return {'success': True, 'gate': gate or UNASSIGNED}
+
+def scanner_label(scanner_id=None):
+    """Metrics label for the scanner page a scan came from
+    
+    Scanner pages are labelled by the Socket.IO session they registered
+    with; scans over HTTP name it in ``scanner_id``. Anything else counts
+    as unregistered, so clients cannot add label values of their own.
+    """
+    scanner_id = getattr(request, 'sid', None) or scanner_id
+    if isinstance(scanner_id, str) and scanner_id in scanner_registrations:
+        return scanner_id
+    return 'unregistered'
+
+@socketio.on('disconnect')
+def unregister_scanner(reason=None):
+    event = scanner_registrations.pop(request.sid, None)
+    if event is not None:
+        SCANS.discard(scanner=request.sid)
+        event.gates.unregister(request.sid)
+        scanners_changed(event)
+        events.release(event)
 
 @app.route('/')
 def index():
@@ -154,29 +329,34 @@ def admin():
     if not session.get('logged_in') or not session.get('is_admin'):
         return redirect(url_for('login'))
     
-    global stats, CSV_PATH
-    update_stats()
+    event = current_event()
+    event.get_store()
     
     # Get system info
     system_info = {
         'server_time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         'uptime': 'Running',
-        'file_uploaded': CSV_PATH is not None and os.path.exists(CSV_PATH)
+        'file_uploaded': os.path.exists(event.csv_path)
     }
+    excel_path = event.csv_path if system_info['file_uploaded'] else None
     
-    return render_template('admin.html', stats=stats, excel_path=CSV_PATH, system_info=system_info)
+    return render_template('admin.html', stats=event.current_stats(), excel_path=excel_path,
+                           system_info=system_info, event_id=event.event_id)
 
 @app.route('/scanner')
 def scanner():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
-    # Update scanner status
-    stats['scanner_status'] = 'online'
-    socketio.emit('scanner_status_update', {'status': 'online'})
-    
+    # Scanner status follows the scanner pages registered over Socket.IO
     return render_template('scanner.html')
 
+def upload_temp_path(event, suffix):
+    """A new empty file in the event's directory for one upload"""
+    descriptor, path = tempfile.mkstemp(dir=event.directory, prefix='upload-', suffix=suffix)
+    os.close(descriptor)
+    return path
+
 @app.route('/upload_excel', methods=['POST'])
 def upload_excel():
     if not session.get('logged_in') or not session.get('is_admin'):
@@ -190,40 +370,73 @@ def upload_excel():
     if file.filename == '':
         return jsonify({'success': False, 'message': 'No selected file'})
     
-    if file and (file.filename.endswith('.csv') or file.filename.endswith('.xlsx')):
+    if file and (file.filename.lower().endswith('.csv') or file.filename.lower().endswith('.xlsx')):
         try:
             # Secure filename
+            event = current_event()
+            os.makedirs(event.directory, exist_ok=True)
             filename = secure_filename(file.filename)
-            filepath = os.path.join(UPLOAD_FOLDER, 'tickets.csv')
-            file.save(filepath)
-            
-            global CSV_PATH
-            CSV_PATH = filepath
+            extension = os.path.splitext(filename)[1].lower()
+            # Concurrent uploads to one event each get their own files; the
+            # last to finish replaces the tickets
+            source_path = upload_temp_path(event, extension)
+            staging_path = upload_temp_path(event, '.import')
+            filepath = event.csv_path
             
-            # Validate the uploaded file
-            data = read_csv_data()
-            if not data:
-                return jsonify({
-                    'success': False, 
-                    'message': 'Invalid file format or empty file'
-                })
-            
-            required_columns = ['name', 'email']
-            missing_columns = [col for col in required_columns if col not in data[0].keys()]
-            
-            if missing_columns:
-                return jsonify({
-                    'success': False, 
-                    'message': f'Missing required columns: {", ".join(missing_columns)}'
-                })
+            try:
+                # Stream and validate the upload; the current tickets stay in
+                # place if it is rejected
+                try:
+                    file.save(source_path)
+                    imported, duplicates = run_blocking(import_ticket_file, source_path, staging_path)
+                except ValueError as e:
+                    return jsonify({'success': False, 'message': str(e)})
+                finally:
+                    # The rows are in the staging CSV now; the upload itself is not kept
+                    if os.path.exists(source_path):
+                        os.remove(source_path)
+                
+                # Merging keeps the loaded tickets and their check-ins and only
+                # applies the new and changed rows, e.g. for late registrations
+                store = event.get_store()
+                if request.form.get('mode') == 'merge' and store is not None and run_blocking(len, store):
+                    with STORE_SECONDS.time('merge'):
+                        inserted, updated, unchanged = run_blocking(store.merge_file, staging_path)
+                    event.update_stats()
+                    
+                    message = f'File merged - {inserted} participants added, {updated} updated, {unchanged} unchanged'
+                    if duplicates:
+                        message += f' ({duplicates} duplicate ticket IDs skipped)'
+                    logger.info(f"Ticket file merged: {inserted} added, {updated} updated, {unchanged} unchanged")
+                    return jsonify({
+                        'success': True,
+                        'message': message,
+                        'inserted': inserted,
+                        'updated': updated,
+                        'unchanged': unchanged
+                    })
+                
+                def replace_tickets():
+                    os.replace(staging_path, filepath)
+                    return open_store(filepath, backend=STORE_BACKEND, fresh=True)
+                
+                with STORE_SECONDS.time('open'):
+                    event.replace_store(replace_tickets)
+            finally:
+                # Only a replacement moves the staging CSV into place
+                if os.path.exists(staging_path):
+                    os.remove(staging_path)
             
             # Update stats
-            update_stats()
+            event.update_stats()
             
-            logger.info(f"CSV file uploaded successfully: {len(data)} records")
+            message = f'File uploaded successfully - {imported} participants loaded'
+            if duplicates:
+                message += f' ({duplicates} duplicate ticket IDs skipped)'
+            logger.info(f"Ticket file uploaded successfully: {imported} records")
             return jsonify({
                 'success': True, 
-                'message': f'File uploaded successfully - {len(data)} participants loaded'
+                'message': message
             })
         
         except Exception as e:
@@ -232,110 +445,234 @@ def upload_excel():
     
     return jsonify({'success': False, 'message': 'Invalid file format. Please upload .csv or .xlsx file'})
 
+def record_scan(event, ticket_id, ticket_row, admitted, scan_time, gate=None, queue_seconds=None, rejected=False,
+                scanner=None):
+    """Update stats, gate counters, recent scans and live feeds for one scan
+
+    ``queue_seconds`` is how long the scan took to reach the server, when
+    the scanner reported its scan time. ``rejected`` marks codes refused
+    before the store lookup; ``scanner`` is the scanner_label(). Gates no
+    scanner registered at are counted as 'other'. Returns the result
+    payload sent back to the scanner.
+    """
+    status = 'invalid' if not ticket_row else 'valid' if admitted else 'already_scanned'
+    gate = event.gates.known_gate(gate)
+    SCANS.inc(event.event_id, status, scanner or 'unregistered', gate or '')
+    event.gates.record(gate, status == 'valid', queue_seconds)
+    
+    with event.stats_lock:
+        event.stats['scanned'] += 1
+        event.stats['last_scan_time'] = datetime.datetime.now().isoformat()
+    
+    if ticket_row:
+        if not admitted:
+            scan_data = {
+                'ticket_id': ticket_id,
+                'name': ticket_row.get('name', 'N/A'),
+                'email': ticket_row.get('email', 'N/A'),
+                'status': 'already_scanned',
+                'scan_time': ticket_row.get('scan_time', 'N/A')
+            }
+            add_recent_scan(event, scan_data, gate)
+            event.broadcaster.stats_changed()
+            
+            return {
+                'success': True,
+                'valid': False,
+                'message': 'Ticket already scanned',
+                'data': scan_data
+            }
+        
+        scan_data = {
+            'ticket_id': ticket_id,
+            'name': ticket_row.get('name', 'N/A'),
+            'email': ticket_row.get('email', 'N/A'),
+            'status': 'valid',
+            'scan_time': scan_time
+        }
+        add_recent_scan(event, scan_data, gate)
+        event.broadcaster.add_scan(scan_data)
+        
+        logger.info(f"Valid ticket scanned: {ticket_id} - {scan_data['name']}")
+        
+        return {
+            'success': True,
+            'valid': True,
+            'message': 'Ticket valid',
+            'data': scan_data
+        }
+    
+    if rejected:
+        # Refused before the store was needed; counted once there is one
+        if event.store is not None:
+            with STORE_SECONDS.time('record_rejected'):
+                run_blocking(event.store.counters.record_rejected)
+    else:
+        with STORE_SECONDS.time('record_invalid'):
+            run_blocking(event.store.counters.record_invalid)
+    event.broadcaster.stats_changed()
+    
+    scan_data = {
+        'ticket_id': ticket_id,
+        'name': 'N/A',
+        'email': 'N/A',
+        'status': 'invalid',
+        'scan_time': scan_time
+    }
+    add_recent_scan(event, scan_data, gate)
+    
+    logger.warning(f"Invalid ticket attempted: {ticket_id}")
+    
+    return {
+        'success': True,
+        'valid': False,
+        'message': 'Invalid ticket',
+        'data': scan_data
+    }
+
+def parse_client_scan_time(value, now):
+    """Normalise a scanner-supplied scan time, falling back to server time
+
+    Accepts ISO 8601 (as sent by JavaScript's toISOString) and never
+    returns a time later than ``now``.
+    """
+    try:
+        scan_time = datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return now
+    if scan_time.tzinfo is not None:
+        scan_time = scan_time.astimezone().replace(tzinfo=None)
+    return min(scan_time, now)
+
+def verify_ticket(scan):
+    """Check in one scanned ticket and return the result payload
+    
+    Shared by /verify and the ``verify`` Socket.IO event; ``scan`` is the
+    request body, ``{"ticket_id": ..., "gate": ..., "scan_time": ...}``; the
+    optional ISO 8601 scan time measures the gate's queue time.
+    """
+    if not session.get('logged_in'):
+        return {'success': False, 'message': 'Unauthorized'}
+    
+    event = current_event()
+    ticket_id = scan.get('ticket_id') if isinstance(scan, dict) else None
+    
+    if not ticket_id:
+        return {'success': False, 'message': 'No ticket ID provided'}
+    
+    try:
+        now = datetime.datetime.now()
+        current_time = now.strftime("%Y-%m-%d %H:%M:%S")
+        queue_seconds = None
+        if scan.get('scan_time'):
+            queue_seconds = (now - parse_client_scan_time(scan['scan_time'], now)).total_seconds()
+        gate = parse_gate(scan.get('gate'))
+        scanner = scanner_label(scan.get('scanner_id'))
+        # Forged and malformed codes are refused before the store is touched
+        ticket_id, rejection = parse_scanned_code(event, ticket_id)
+        if rejection:
+            return reject_scan(event, ticket_id, rejection, current_time, gate, queue_seconds, scanner)
+        
+        store = event.get_store()
+        if store is None:
+            return {'success': False, 'message': 'No CSV file uploaded'}
+        
+        # Find ticket by UUID and admit it at most once, even when several
+        # scanners submit the same ticket concurrently
+        def check_in():
+            if not len(store):
+                return None
+            return store.check_in(ticket_id, current_time)
+        
+        with STORE_SECONDS.time('check_in'):
+            outcome = run_blocking(check_in)
+        if outcome is None:
+            return {'success': False, 'message': 'No data found in CSV'}
+        ticket_row, admitted = outcome
+        
+        return record_scan(event, ticket_id, ticket_row, admitted, current_time, gate, queue_seconds,
+                           scanner=scanner)
+    
+    except Exception as e:
+        logger.error(f"Error verifying ticket {ticket_id}: {e}")
+        return {'success': False, 'message': f'Error: {str(e)}'}
+
 @app.route('/verify', methods=['POST'])
 def verify():
+    return jsonify(verify_ticket(request.json))
+
+@socketio.on('verify')
+def verify_event(scan=None):
+    """Verify a scan over the scanner's socket; the result is the ack
+    
+    Events are handled concurrently, so a scanner can keep several scans
+    in flight and match each ack to its scan.
+    """
+    with SOCKET_EVENT_SECONDS.time('verify'):
+        return verify_ticket(scan)
+
+@app.route('/verify_batch', methods=['POST'])
+def verify_batch():
+    """Apply scans queued by an offline scanner in one store batch
+    
+    Expects ``{"scans": [{"ticket_id": ..., "scan_time": ..., "gate": ...}, ...]}``,
+    plus the ``scanner_id`` of a registered scanner page, and returns one /verify result per scan, in request order. Scans are applied
+    in client scan-time order, so the earliest scan of a ticket wins.
+    """
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global CSV_PATH, stats
+    event = current_event()
+    store = event.get_store()
     
-    if not CSV_PATH or not os.path.exists(CSV_PATH):
+    if store is None:
         return jsonify({'success': False, 'message': 'No CSV file uploaded'})
     
-    ticket_id = request.json.get('ticket_id')
+    body = request.get_json(silent=True)
+    scans = body.get('scans') if isinstance(body, dict) else None
     
-    if not ticket_id:
-        return jsonify({'success': False, 'message': 'No ticket ID provided'})
+    if not isinstance(scans, list) or not scans:
+        return jsonify({'success': False, 'message': 'No scans provided'}), 400
+    
+    if len(scans) > MAX_VERIFY_BATCH:
+        return jsonify({'success': False, 'message': f'At most {MAX_VERIFY_BATCH} scans per batch'}), 400
+    
+    scanner = scanner_label(body.get('scanner_id'))
     
     try:
-        data = read_csv_data()
-        
-        if not data:
-            return jsonify({'success': False, 'message': 'No data found in CSV'})
+        now = datetime.datetime.now()
+        results = [{'success': False, 'message': 'No ticket ID provided'}] * len(scans)
+        batch = []
+        for position, scan in enumerate(scans):
+            ticket_id = scan.get('ticket_id') if isinstance(scan, dict) else None
+            if ticket_id:
+                scan_time = parse_client_scan_time(scan.get('scan_time'), now)
+                gate = parse_gate(scan.get('gate'))
+                ticket_id, rejection = parse_scanned_code(event, ticket_id)
+                if rejection:
+                    results[position] = reject_scan(event, ticket_id, rejection,
+                                                    scan_time.strftime("%Y-%m-%d %H:%M:%S"), gate,
+                                                    scanner=scanner)
+                    continue
+                batch.append((scan_time, position, ticket_id, gate))
+        batch.sort()
         
-        # Find ticket by UUID
-        ticket_row = None
-        for row in data:
-            if row.get('uuid') == ticket_id:
-                ticket_row = row
-                break
+        scan_times = [scan_time.strftime("%Y-%m-%d %H:%M:%S") for scan_time, _, _, _ in batch]
+        with STORE_SECONDS.time('check_in_many'):
+            outcomes = run_blocking(store.check_in_many, [
+                (ticket_id, scan_time) for (_, _, ticket_id, _), scan_time in zip(batch, scan_times)
+            ])
+        # Scans queued while offline count towards gate throughput but not
+        # queue time, which would otherwise report the outage
+        for (_, position, ticket_id, gate), scan_time, (ticket_row, admitted) in zip(batch, scan_times, outcomes):
+            results[position] = record_scan(event, ticket_id, ticket_row, admitted, scan_time, gate,
+                                            scanner=scanner)
         
-        stats['scanned'] += 1
-        stats['last_scan_time'] = datetime.datetime.now().isoformat()
-        
-        if ticket_row:
-            if ticket_row.get('scanned') == 'True':
-                scan_data = {
-                    'ticket_id': ticket_id,
-                    'name': ticket_row.get('name', 'N/A'),
-                    'email': ticket_row.get('email', 'N/A'),
-                    'status': 'already_scanned',
-                    'scan_time': ticket_row.get('scan_time', 'N/A')
-                }
-                add_recent_scan(scan_data)
-                socketio.emit('stats_update', stats)
-                
-                return jsonify({
-                    'success': True,
-                    'valid': False,
-                    'message': 'Ticket already scanned',
-                    'data': scan_data
-                })
-            
-            # Mark as scanned
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ticket_row['scanned'] = 'True'
-            ticket_row['scan_time'] = current_time
-            
-            # Update CSV file
-            write_csv_data(data)
-            
-            stats['valid'] += 1
-            update_stats()
-            
-            scan_data = {
-                'ticket_id': ticket_id,
-                'name': ticket_row.get('name', 'N/A'),
-                'email': ticket_row.get('email', 'N/A'),
-                'status': 'valid',
-                'scan_time': current_time
-            }
-            add_recent_scan(scan_data)
-            socketio.emit('stats_update', stats)
-            socketio.emit('new_scan', scan_data)
-            
-            logger.info(f"Valid ticket scanned: {ticket_id} - {scan_data['name']}")
-            
-            return jsonify({
-                'success': True,
-                'valid': True,
-                'message': 'Ticket valid',
-                'data': scan_data
-            })
-        else:
-            stats['invalid'] += 1
-            socketio.emit('stats_update', stats)
-            
-            scan_data = {
-                'ticket_id': ticket_id,
-                'name': 'N/A',
-                'email': 'N/A',
-                'status': 'invalid',
-                'scan_time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            add_recent_scan(scan_data)
-            
-            logger.warning(f"Invalid ticket attempted: {ticket_id}")
-            
-            return jsonify({
-                'success': True,
-                'valid': False,
-                'message': 'Invalid ticket',
-                'data': scan_data
-            })
+        logger.info(f"Applied batch of {len(batch)} scans")
+        return jsonify({'success': True, 'results': results})
     
     except Exception as e:
-        logger.error(f"Error verifying ticket {ticket_id}: {e}")
+        logger.error(f"Error verifying batch: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
 @app.route('/generate_tickets', methods=['POST'])
@@ -343,92 +680,225 @@ def generate_tickets():
     if not session.get('logged_in') or not session.get('is_admin'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global CSV_PATH
+    event = current_event()
+    store = event.get_store()
     
-    if not CSV_PATH:
+    if store is None:
         return jsonify({'success': False, 'message': 'No CSV file uploaded'})
     
     try:
-        data = read_csv_data()
-        
-        if not data:
+        if not run_blocking(len, store):
             return jsonify({'success': False, 'message': 'No data found in CSV'})
         
-        # Generate UUIDs if not present
-        for row in data:
-            if 'uuid' not in row or not row['uuid']:
-                row['uuid'] = str(uuid.uuid4())
-            if 'scanned' not in row:
-                row['scanned'] = 'False'
-            if 'scan_time' not in row:
-                row['scan_time'] = ''
-        
-        # Generate QR codes
-        qr_codes = []
+        # Generate UUIDs if not present and persist them
+        with STORE_SECONDS.time('assign_ticket_ids'):
+            run_blocking(store.assign_ticket_ids)
         
-        for row in data:
-            ticket_id = row['uuid']
-            img = qrcode.make(ticket_id)
-            buffered = BytesIO()
-            img.save(buffered, format='PNG')
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            qr_codes.append({
-                'ticket_id': ticket_id,
-                'qr_code': img_str,
-                'name': row.get('name', 'Unknown'),
-                'email': row.get('email', 'N/A')
-            })
+        # Pre-render QR codes into the cache; images are served by /qr/<uuid>.png
+        with QR_RENDER_SECONDS.time('warm_cache'):
+            rendered = run_blocking(qr_render.warm_cache, (qr_payload(event, row) for row in store.iter_rows()))
         
-        # Write updated data back to CSV
-        write_csv_data(data)
-        update_stats()
+        event.update_stats()
         
-        logger.info(f"Generated {len(qr_codes)} tickets")
+        total = run_blocking(len, store)
+        with STORE_SECONDS.time('page'):
+            tickets, next_cursor = run_blocking(store.page, 0, QR_PAGE_SIZE)
+        logger.info(f"Generated {total} tickets ({rendered} QR codes rendered)")
         
         return jsonify({
             'success': True, 
-            'message': f'{len(qr_codes)} tickets generated successfully', 
-            'qr_codes': qr_codes
+            'message': f'{total} tickets generated successfully', 
+            'total': total,
+            'tickets': [ticket_summary(event, row) for row in tickets],
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
         logger.error(f"Error generating tickets: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+@app.route('/tickets')
+def list_tickets():
+    """Page through generated tickets with their QR image URLs"""
+    if not session.get('logged_in') or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    event = current_event()
+    store = event.get_store()
+    
+    if store is None:
+        return jsonify({'success': False, 'message': 'No CSV file uploaded'})
+    
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', QR_PAGE_SIZE, type=int), 1), MAX_QR_PAGE_SIZE)
+    with STORE_SECONDS.time('page'):
+        tickets, next_cursor = run_blocking(store.page, cursor, limit)
+    
+    return jsonify({
+        'success': True,
+        'total': run_blocking(len, store),
+        'tickets': [ticket_summary(event, row) for row in tickets if row.get('uuid')],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/qr/<ticket_id>.png')
+def qr_image(ticket_id):
+    """Serve one ticket's QR code
+    
+    Requested with the current version (``v``, the image's ETag) it is
+    cached for a year; any other URL is revalidated against the ETag.
+    """
+    if not session.get('logged_in') or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    event = current_event()
+    store = event.get_store()
+    row = run_blocking(store.get, ticket_id) if store is not None else None
+    if row is None:
+        return jsonify({'success': False, 'message': 'Ticket not found'}), 404
+    
+    payload = qr_payload(event, row)
+    with QR_RENDER_SECONDS.time('get_qr_png'):
+        png = run_blocking(qr_render.get_qr_png, payload)
+    response = app.response_class(png, mimetype='image/png')
+    etag = qr_render.qr_etag(payload)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if request.args.get('v') == etag:
+        response.cache_control.max_age = 365 * 24 * 3600
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/export_tickets.zip')
+def export_tickets_zip():
+    """Stream a ZIP of every ticket's QR code, rendered as it is sent"""
+    if not session.get('logged_in') or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    
+    event = current_event()
+    current_store = event.get_store()
+    if current_store is None or not run_blocking(len, current_store):
+        return jsonify({'success': False, 'message': 'No tickets to export'}), 404
+    
+    def entries():
+        for row in current_store.iter_rows():
+            if row.get('uuid'):
+                name = secure_filename(row.get('name', '')) or 'ticket'
+                yield f"{name}_{row['uuid']}.png", qr_payload(event, row)
+    
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return app.response_class(
+        iter_blocking(qr_render.iter_qr_zip(entries())),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=tickets_{timestamp}.zip'}
+    )
+
 @app.route('/get_stats')
 def get_stats():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global stats
-    update_stats()
+    event = current_event()
+    event.get_store()
     
-    return jsonify({'success': True, 'stats': stats})
+    return jsonify({'success': True, 'stats': event.current_stats()})
 
 @app.route('/get_recent_scans')
 def get_recent_scans():
+    """Recent scans, oldest first, a page at a time
+    
+    Pass ``since`` (the last ``cursor``) and ``source`` to get only newer
+    scans; ``more`` says another page is waiting. A cursor from another
+    process's feed starts over from its oldest scan.
+    """
     if not session.get('logged_in'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    return jsonify({'success': True, 'scans': recent_scans[:20]})
+    feed = current_event().recent_scans
+    since = request.args.get('since', 0, type=int)
+    if request.args.get('source') not in (None, feed.source):
+        since = 0
+    limit = min(max(request.args.get('limit', RECENT_SCANS_PAGE, type=int), 1), MAX_RECENT_SCANS)
+    scans, cursor = feed.since(since, gate=request.args.get('gate'), limit=limit)
+    
+    return jsonify({'success': True, 'scans': scans, 'cursor': cursor, 'source': feed.source,
+                    'more': cursor < feed.last_id})
+
+def get_ticket_bloom(event):
+    """Return (version, filter dict) for the event's current ticket set"""
+    store = event.store
+    version = store.ticket_set_id
+    with event.ticket_bloom_lock:
+        if event.ticket_bloom is None or event.ticket_bloom[0] != version:
+            bloom = BloomFilter.for_capacity(len(store), TICKET_BLOOM_FP_RATE)
+            for row in store.iter_rows():
+                if row.get('uuid'):
+                    bloom.add(row['uuid'])
+            event.ticket_bloom = (version, bloom.to_dict())
+            logger.info(f"Built ticket snapshot filter for {len(store)} tickets of event {event.event_id}")
+        return event.ticket_bloom
+
+@app.route('/ticket_snapshot')
+def ticket_snapshot():
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    event = current_event()
+    store = event.get_store()
+    
+    if store is None:
+        return jsonify({'success': False, 'message': 'No CSV file uploaded'})
+    
+    version, bloom = run_blocking(get_ticket_bloom, event)
+    scanned, cursor = run_blocking(store.counters.scanned_since, 0)
+    
+    return jsonify({
+        'success': True,
+        'version': version,
+        'ticket_count': run_blocking(len, store),
+        'bloom': bloom,
+        'scanned': scanned,
+        'cursor': cursor
+    })
+
+@app.route('/ticket_snapshot/changes')
+def ticket_snapshot_changes():
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    store = current_event().get_store()
+    
+    if store is None:
+        return jsonify({'success': False, 'message': 'No CSV file uploaded'})
+    
+    # A new ticket set invalidates the scanner's filter; it must refetch
+    if request.args.get('version') != run_blocking(getattr, store, 'ticket_set_id'):
+        return jsonify({'success': True, 'reset': True})
+    
+    since = request.args.get('since', 0, type=int)
+    scanned, cursor = run_blocking(store.counters.scanned_since, max(since, 0))
+    
+    return jsonify({'success': True, 'scanned': scanned, 'cursor': cursor})
 
 @app.route('/export_data')
 def export_data():
     if not session.get('logged_in') or not session.get('is_admin'):
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    global CSV_PATH
+    event = current_event()
+    store = event.get_store()
     
-    if not CSV_PATH or not os.path.exists(CSV_PATH):
+    if store is None or not os.path.exists(event.csv_path):
         return jsonify({'success': False, 'message': 'No data to export'})
     
     try:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        export_path = os.path.join(UPLOAD_FOLDER, f'export_{timestamp}.csv')
+        export_path = os.path.join(event.directory, f'export_{timestamp}.csv')
         
-        # Copy the current CSV file
-        import shutil
-        shutil.copy2(CSV_PATH, export_path)
+        # Write the current ticket state, including journalled check-ins
+        with STORE_SECONDS.time('export_csv'):
+            run_blocking(store.export_csv, export_path)
         
         return jsonify({
             'success': True, 
@@ -439,15 +909,39 @@ def export_data():
         logger.error(f"Error exporting data: {e}")
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+@app.route('/events')
+def list_events():
+    """Events with uploaded tickets, and whether each is loaded in memory"""
+    if not session.get('logged_in') or not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    
+    event_ids = {DEFAULT_EVENT}
+    if os.path.isdir(EVENTS_FOLDER):
+        event_ids.update(entry.name for entry in os.scandir(EVENTS_FOLDER)
+                         if entry.is_dir() and valid_event_id(entry.name))
+    loaded = set(events.loaded())
+    
+    return jsonify({
+        'success': True,
+        'current': session.get('event_id') or DEFAULT_EVENT,
+        'events': [{'event_id': event_id, 'loaded': event_id in loaded} for event_id in sorted(event_ids)]
+    })
+
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring"""
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.datetime.now().isoformat(),
-        'stats': stats
+        'stats': current_event().current_stats(),
+        'loaded_events': events.loaded()
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Latency histograms and counters in the Prometheus text format"""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     # Enhanced configuration for production use
     print("🚀 Starting Ticket Manager Server...")
@@ -466,7 +960,7 @@ if __name__ == '__main__':
     socketio.run(
         app, 
         host='0.0.0.0',  # Allow external connections
-        port=5000, 
+        port=int(os.environ.get('PORT', 5000)),
         debug=False,  # Disable debug for production
         allow_unsafe_werkzeug=True  # Allow external access
     )
@@ -0,0 +1,186 @@
+"""Benchmark the ticket manager's hot paths.
+
+Synthesizes a ticket file with dummy.py's generator, then drives upload,
+/generate_tickets, /verify (over HTTP and the ``verify`` Socket.IO event)
+and /get_stats through the Flask test clients, sequentially and from
+concurrent clients, and reports throughput and p50/p95/p99 latency per
+endpoint:
+
+    python benchmark.py --tickets 10000 --requests 2000 --concurrency 8
+
+Everything runs in a temporary directory, so existing uploads are left
+alone. Use --json to save the results for comparison between runs.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import dummy
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(name, latencies, errors, elapsed):
+    return {
+        'endpoint': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def login(app, username):
+    client = app.test_client()
+    client.post('/login', data={'username': username, 'password': username})
+    return client
+
+
+def run_requests(name, app, username, calls, concurrency, connect=None):
+    """Run ``calls`` (functions taking a client) over ``concurrency`` clients
+
+    ``connect`` turns each logged-in HTTP client into the client passed to
+    the calls, e.g. a Socket.IO test client sharing its session.
+    """
+    clients = [login(app, username) for _ in range(concurrency)]
+    if connect is not None:
+        clients = [connect(client) for client in clients]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    work = list(enumerate(calls))
+
+    def worker(client, index):
+        for _, call in work[index::concurrency]:
+            start = time.perf_counter()
+            ok = call(client)
+            duration = time.perf_counter() - start
+            with lock:
+                latencies.append(duration)
+                if not ok:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(client, i)) for i, client in enumerate(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(name, latencies, errors[0], time.perf_counter() - start)
+
+
+def succeeded(response):
+    return response.status_code == 200 and (response.get_json() or {}).get('success', False)
+
+
+def run_benchmark(tickets=5000, requests=2000, concurrency=8, uploads=3, generates=2):
+    """Run every benchmark in a scratch directory and return the result rows"""
+    original_dir = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='ticket-bench-')
+    os.chdir(workdir)
+    try:
+        ticket_rows = dummy.write_tickets_csv('bench_tickets.csv', tickets)
+        ticket_ids = [row['uuid'] for row in ticket_rows]
+
+        # Imported late: the app resolves its upload folder in the working directory
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import app_simple
+        logging.getLogger().setLevel(logging.ERROR)
+        app = app_simple.app
+
+        def upload(client):
+            with open('bench_tickets.csv', 'rb') as file:
+                return succeeded(client.post('/upload_excel', data={'file': (file, 'bench_tickets.csv')},
+                                             content_type='multipart/form-data'))
+
+        def generate(client):
+            return succeeded(client.post('/generate_tickets'))
+
+        def stats(client):
+            return succeeded(client.get('/get_stats'))
+
+        def verify(ticket_id):
+            return lambda client: succeeded(client.post('/verify', json={'ticket_id': ticket_id}))
+
+        def socket_client(client):
+            return app_simple.socketio.test_client(app, flask_test_client=client)
+
+        def verify_socket(ticket_id):
+            def call(client):
+                return (client.emit('verify', {'ticket_id': ticket_id}, callback=True) or {}).get('success', False)
+            return call
+
+        results = [
+            run_requests('upload', app, 'admin', [upload] * uploads, 1),
+            # The first run renders every QR code; later runs hit the cache
+            run_requests('generate_tickets', app, 'admin', [generate] * generates, 1)
+        ]
+
+        # Mostly first scans, with some repeats and unknown tickets
+        rng = random.Random(42)
+        scan_ids = []
+        for i in range(requests):
+            roll = rng.random()
+            if roll < 0.1:
+                scan_ids.append(str(rng.random()))
+            elif roll < 0.2 and scan_ids:
+                scan_ids.append(rng.choice(scan_ids))
+            else:
+                scan_ids.append(ticket_ids[i % len(ticket_ids)])
+        half = len(scan_ids) // 2
+        results.append(run_requests('verify', app, 'scanner', [verify(t) for t in scan_ids[:half]], 1))
+        results.append(run_requests(f'verify x{concurrency}', app, 'scanner',
+                                    [verify(t) for t in scan_ids[half:]], concurrency))
+        # The same scans again (now mostly repeats) over the scanners' sockets
+        results.append(run_requests('verify socket', app, 'scanner',
+                                    [verify_socket(t) for t in scan_ids[:half]], 1, socket_client))
+
+        results.append(run_requests('get_stats', app, 'admin', [stats] * requests, 1))
+        results.append(run_requests(f'get_stats x{concurrency}', app, 'admin', [stats] * requests, concurrency))
+
+        app_simple.shutdown()
+        return results
+    finally:
+        os.chdir(original_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_results(results):
+    print(f"{'endpoint':<22}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for result in results:
+        print(f"{result['endpoint']:<22}{result['requests']:>9}{result['errors']:>8}"
+              f"{result['throughput']:>10.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ticket manager endpoints')
+    parser.add_argument('--tickets', type=int, default=5000, help='tickets in the synthesized file')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per verify/stats benchmark')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--uploads', type=int, default=3, help='upload runs')
+    parser.add_argument('--generates', type=int, default=2, help='generate_tickets runs')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.tickets, args.requests, args.concurrency, args.uploads, args.generates)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,60 @@
+"""Bloom filter of ticket IDs for the scanner's offline snapshot.
+
+The scanner page (templates/scanner.html) re-implements the membership
+test in JavaScript, so the hashing is deliberately simple: two 32-bit
+FNV-1a hashes of the UTF-8 key combined by double hashing. Keep both
+sides in sync when changing anything here.
+"""
+import base64
+import math
+
+FNV_PRIME = 0x01000193
+FNV_BASIS = 0x811c9dc5
+# Second offset basis, giving an independent-enough second hash
+FNV_BASIS_2 = 0x050c5d1f
+
+
+def fnv1a_32(data, basis=FNV_BASIS):
+    h = basis
+    for byte in data:
+        h ^= byte
+        h = (h * FNV_PRIME) & 0xffffffff
+    return h
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys"""
+
+    def __init__(self, bits, hashes):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, count, false_positive_rate=0.01):
+        """Size a filter for ``count`` keys at the given false positive rate"""
+        count = max(count, 1)
+        bits = max(64, math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2))
+        hashes = max(1, round(bits / count * math.log(2)))
+        return cls(bits, hashes)
+
+    def _positions(self, key):
+        data = key.encode('utf-8')
+        h1 = fnv1a_32(data)
+        h2 = fnv1a_32(data, FNV_BASIS_2) | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits
+
+    def add(self, key):
+        for bit in self._positions(key):
+            self.data[bit >> 3] |= 1 << (bit & 7)
+
+    def __contains__(self, key):
+        return all(self.data[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def to_dict(self):
+        return {
+            'bits': self.bits,
+            'hashes': self.hashes,
+            'data': base64.b64encode(bytes(self.data)).decode()
+        }
@@ -0,0 +1,88 @@
+"""Coalesced Socket.IO broadcasts for the live dashboards.
+
+Scans only mark the stats as changed and queue their feed entry; a
+background task flushes at a fixed rate, sending at most one
+``stats_update`` and one ``new_scan`` (a list of scans) per interval no
+matter how many scans arrived in between.
+"""
+import logging
+import threading
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+EMIT_SECONDS = Histogram('ticket_socket_emit_seconds', 'Time spent emitting Socket.IO events', ['event'])
+
+
+class BroadcastAggregator:
+    """Collects dashboard updates and emits them from a background task
+
+    ``stats_provider`` is called at flush time and returns the stats
+    payload, so dashboards always receive the latest numbers. With a
+    ``room``, updates only go to the clients in that room.
+    """
+
+    def __init__(self, socketio, stats_provider, interval=0.5, max_batch=200, room=None):
+        self.socketio = socketio
+        self.stats_provider = stats_provider
+        self.room = room
+        self.interval = interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._stats_dirty = False
+        self._scans = []
+        self._task = None
+        self._running = False
+
+    def start(self):
+        """Start the flush task if it is not running yet"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._task = self.socketio.start_background_task(self._run)
+
+    def stop(self):
+        self._running = False
+
+    def stats_changed(self):
+        with self._lock:
+            self._stats_dirty = True
+        self.start()
+
+    def add_scan(self, scan_data):
+        with self._lock:
+            self._scans.append(scan_data)
+            self._stats_dirty = True
+            # Dashboards only show the latest scans; drop the oldest if
+            # the feed backs up
+            if len(self._scans) > self.max_batch:
+                del self._scans[:-self.max_batch]
+        self.start()
+
+    def flush(self):
+        """Emit pending updates; returns the number of events sent"""
+        with self._lock:
+            stats_dirty, self._stats_dirty = self._stats_dirty, False
+            scans, self._scans = self._scans, []
+
+        emitted = 0
+        if stats_dirty:
+            with EMIT_SECONDS.time('stats_update'):
+                self.socketio.emit('stats_update', self.stats_provider(), to=self.room)
+            emitted += 1
+        if scans:
+            with EMIT_SECONDS.time('new_scan'):
+                self.socketio.emit('new_scan', scans, to=self.room)
+            emitted += 1
+        return emitted
+
+    def _run(self):
+        while self._running:
+            self.socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error broadcasting updates: {e}")
+        self.flush()
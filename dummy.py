@@ -1,4 +1,4 @@
-import pandas as pd
+import csv
 import uuid
 
 # Create dummy data for ticket verification system
@@ -87,19 +87,52 @@ data = {
         'Paid',
         'Pending',
         'Paid'
-    ],
-    'uuid': [str(uuid.uuid4()) for _ in range(15)],
-    'scanned': [False] * 15,
-    'scan_time': [None] * 15
+    ]
 }
 
-# Create DataFrame
-df = pd.DataFrame(data)
+def generate_tickets(count=15):
+    """Return ``count`` dummy ticket rows, cycling through the sample attendees
 
-# Save to Excel
-df.to_excel('dummy_tickets.xlsx', index=False)
+    Repeats of an attendee get a numbered email so every row is distinct.
+    """
+    sample_size = len(data['name'])
+    tickets = []
+    for i in range(count):
+        j, repeat = i % sample_size, i // sample_size
+        email = data['email'][j]
+        if repeat:
+            email = email.replace('@', f'+{repeat}@')
+        tickets.append({
+            'name': data['name'][j],
+            'email': email,
+            'ticket_type': data['ticket_type'][j],
+            'registration_date': data['registration_date'][j],
+            'payment_status': data['payment_status'][j],
+            'uuid': str(uuid.uuid4()),
+            'scanned': False,
+            'scan_time': None
+        })
+    return tickets
 
-# Save to CSV
-df.to_csv('dummy_tickets.csv', index=False)
+def write_tickets_csv(path, count=15):
+    """Write ``count`` dummy tickets to a CSV file and return them"""
+    tickets = generate_tickets(count)
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=list(tickets[0].keys()))
+        writer.writeheader()
+        writer.writerows(tickets)
+    return tickets
 
-print("Dummy data files created: dummy_tickets.xlsx and dummy_tickets.csv")
\ No newline at end of file
+if __name__ == '__main__':
+    import pandas as pd
+    
+    # Create DataFrame
+    df = pd.DataFrame(generate_tickets(15))
+    
+    # Save to Excel
+    df.to_excel('dummy_tickets.xlsx', index=False)
+    
+    # Save to CSV
+    df.to_csv('dummy_tickets.csv', index=False)
+    
+    print("Dummy data files created: dummy_tickets.xlsx and dummy_tickets.csv")
\ No newline at end of file
@@ -0,0 +1,244 @@
+"""Events served by one ticket server.
+
+Each event has its own ticket file, ticket store (with its UUID index and
+scan counters), recent scans feed, dashboard stats and Socket.IO room.
+Events are loaded on first use and closed again once idle, so memory
+follows the events being scanned rather than every event ever uploaded.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from gate_stats import GateStats
+from scan_feed import RecentScans
+from server_mode import native_lock
+
+logger = logging.getLogger(__name__)
+
+# Event IDs name directories and Socket.IO rooms and are part of signed QR
+# payloads, so they are restricted to a safe alphabet
+EVENT_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+
+def valid_event_id(event_id):
+    return isinstance(event_id, str) and EVENT_ID_PATTERN.fullmatch(event_id) is not None
+
+
+def event_room(event_id):
+    """Socket.IO room of an event's dashboards and scanners"""
+    return f'event:{event_id}'
+
+
+class Event:
+    """One event's ticket store and live state
+
+    ``open_store`` is called with the event's ticket CSV path and returns
+    a store, or None while nothing has been uploaded. The app attaches a
+    ``broadcaster`` and a QR ``signer`` when it creates the event.
+    ``gates`` counts scans and registered scanners per gate over the last
+    ``gate_window`` seconds. Closing and replacing the store run through
+    ``blocking(func)`` (e.g. server_mode.run_blocking), so the store lock
+    is only ever taken on the event loop.
+    """
+
+    def __init__(self, event_id, directory, open_store, recent_scans_capacity=500, gate_window=300,
+                 blocking=None):
+        self.event_id = event_id
+        self.directory = directory
+        self.csv_path = os.path.join(directory, 'tickets.csv')
+        self.room = event_room(event_id)
+        self._open_store = open_store
+        self._blocking = blocking or (lambda func: func())
+        self._store_lock = threading.Lock()
+        self.store = open_store(self.csv_path)
+        self.recent_scans = RecentScans(recent_scans_capacity)
+        self.gates = GateStats(gate_window)
+        self.stats = {
+            'scanned': 0,
+            'valid': 0,
+            'invalid': 0,
+            'total_tickets': 0,
+            'scanned_today': 0,
+            'last_scan_time': None,
+            'scanner_status': 'offline',
+            'scanners': 0
+        }
+        self.stats_lock = threading.Lock()
+        # (ticket set version, filter dict) sent to scanners
+        self.ticket_bloom = None
+        # Taken by the filter build, which runs in the threadpool
+        self.ticket_bloom_lock = native_lock()
+        self.broadcaster = None
+        self.signer = None
+        self.active = 0
+        self.last_used = time.monotonic()
+
+    def get_store(self):
+        """The ticket store, opened if tickets have appeared since loading"""
+        if self.store is None:
+            with self._store_lock:
+                if self.store is None:
+                    self.store = self._open_store(self.csv_path)
+        return self.store
+
+    def replace_store(self, open_new):
+        """Close the current store and install the one ``open_new()`` returns"""
+        with self._store_lock:
+            if self.store is not None:
+                self._blocking(self.store.close)
+                self.store = None
+            self.store = self._blocking(open_new)
+        return self.store
+
+    def update_stats(self):
+        """Refresh statistics from the ticket store's counters and registered scanners"""
+        store = self.store
+        counts = self._blocking(store.counters.snapshot) if store is not None else None
+        scanners = self.gates.scanner_count()
+        with self.stats_lock:
+            if counts is not None:
+                self.stats.update(counts)
+                self.stats['scanned'] = self.stats['valid'] + self.stats['invalid']
+            self.stats['scanners'] = scanners
+            self.stats['scanner_status'] = 'online' if scanners else 'offline'
+
+    def current_stats(self):
+        """Copy of the latest statistics, with per-gate rates, for dashboard broadcasts"""
+        self.update_stats()
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['gates'] = self.gates.snapshot()
+        return stats
+
+    def close(self):
+        """Stop broadcasting and close the store, compacting pending check-ins"""
+        if self.broadcaster is not None:
+            self.broadcaster.stop()
+        with self._store_lock:
+            if self.store is not None:
+                self._blocking(self.store.close)
+                self.store = None
+
+
+class EventRegistry:
+    """Loaded events by ID
+
+    ``factory(event_id)`` creates an Event on first use. Events not used
+    for ``idle_seconds`` are closed and dropped, as are the least recently
+    used ones once more than ``max_loaded`` are loaded. Events in use by a
+    request (between acquire() and release()) are never evicted, and an
+    evicted event is only loaded again once it has finished closing.
+    """
+
+    # Seconds between idle sweeps when under the max_loaded limit
+    SWEEP_INTERVAL = 10
+
+    def __init__(self, factory, idle_seconds=900, max_loaded=50):
+        self.factory = factory
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max_loaded
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._last_sweep = time.monotonic()
+
+    def acquire(self, event_id):
+        """Return the event, loading it if needed, and mark it in use"""
+        while True:
+            with self._lock:
+                event = self._events.get(event_id)
+                if event is not None:
+                    self._mark_used(event)
+                    break
+                loading = self._loading.setdefault(event_id, threading.Lock())
+
+            # Load outside the registry lock so other events keep serving;
+            # concurrent first requests for one event wait for one load, and
+            # requests for an event being closed wait for the close
+            with loading:
+                with self._lock:
+                    event = self._events.get(event_id)
+                    if event is not None:
+                        self._mark_used(event)
+                        break
+                    if self._loading.get(event_id) is not loading:
+                        # Waited for a close; race for the next load
+                        continue
+                event = self.factory(event_id)
+                logger.info(f"Loaded event {event_id}")
+                with self._lock:
+                    self._events[event_id] = event
+                    self._loading.pop(event_id, None)
+                    self._mark_used(event)
+                break
+
+        with self._lock:
+            evicted = self._take_evictable()
+        for old, closing in evicted:
+            self._close(old, closing)
+        return event
+
+    def _mark_used(self, event):
+        self._events.move_to_end(event.event_id)
+        event.active += 1
+        event.last_used = time.monotonic()
+
+    def release(self, event):
+        with self._lock:
+            event.active -= 1
+            event.last_used = time.monotonic()
+
+    @contextmanager
+    def using(self, event_id):
+        event = self.acquire(event_id)
+        try:
+            yield event
+        finally:
+            self.release(event)
+
+    def loaded(self):
+        """IDs of the events currently in memory"""
+        with self._lock:
+            return list(self._events)
+
+    def _take_evictable(self):
+        now = time.monotonic()
+        if len(self._events) <= self.max_loaded and now - self._last_sweep < self.SWEEP_INTERVAL:
+            return []
+        self._last_sweep = now
+        evicted = []
+        # Oldest first, so the cap evicts the least recently used events
+        for event_id, event in list(self._events.items()):
+            if event.active:
+                continue
+            if now - event.last_used >= self.idle_seconds or len(self._events) > self.max_loaded:
+                # Held until the event is closed, so a reload reads the
+                # ticket file only after pending check-ins are compacted
+                closing = threading.Lock()
+                closing.acquire()
+                self._loading[event_id] = closing
+                evicted.append((self._events.pop(event_id), closing))
+        return evicted
+
+    def _close(self, event, closing=None):
+        try:
+            event.close()
+            logger.info(f"Unloaded idle event {event.event_id}")
+        except Exception as e:
+            logger.error(f"Error unloading event {event.event_id}: {e}")
+        finally:
+            if closing is not None:
+                with self._lock:
+                    if self._loading.get(event.event_id) is closing:
+                        del self._loading[event.event_id]
+                closing.release()
+
+    def close_all(self):
+        with self._lock:
+            events, self._events = list(self._events.values()), OrderedDict()
+        for event in events:
+            self._close(event)
@@ -0,0 +1,126 @@
+"""Per-gate throughput for the admin dashboard.
+
+Scans are counted per gate in fixed time buckets covering a rolling
+window, so rates are computed from a handful of counters instead of the
+scan history and old scans age out on their own. Scanner pages register
+with their gate, so the dashboard can compare gates per scanner and move
+staff to the slowest one.
+"""
+import threading
+import time
+from collections import deque
+
+# Gate reported for scanners that did not name one
+UNASSIGNED = 'unassigned'
+
+# Gate reported for scans naming a gate no scanner registered at
+OTHER = 'other'
+
+
+class _GateWindow:
+    __slots__ = ('buckets', 'first_seen', 'last_scan')
+
+    def __init__(self):
+        # [bucket start, scans, valid, queue seconds total, queue samples]
+        self.buckets = deque()
+        self.first_seen = None
+        self.last_scan = None
+
+
+class GateStats:
+    """Thread-safe rolling scan counters and registered scanners per gate
+
+    ``window`` is the rolling window in seconds, split into buckets of
+    ``bucket`` seconds.
+    """
+
+    def __init__(self, window=300, bucket=10):
+        self.window = window
+        self.bucket = bucket
+        self._gates = {}
+        self._scanners = {}
+        self._registered_gates = set()
+        self._lock = threading.Lock()
+
+    def _gate(self, gate):
+        window = self._gates.get(gate)
+        if window is None:
+            window = self._gates[gate] = _GateWindow()
+        return window
+
+    def _prune(self, window, now):
+        while window.buckets and window.buckets[0][0] <= now - self.window:
+            window.buckets.popleft()
+
+    def register(self, scanner_id, gate=None):
+        """Count a connected scanner at a gate, moving it if it was elsewhere"""
+        with self._lock:
+            self._scanners[scanner_id] = gate or UNASSIGNED
+            self._registered_gates.add(gate or UNASSIGNED)
+            self._gate(gate or UNASSIGNED)
+
+    def unregister(self, scanner_id):
+        with self._lock:
+            self._scanners.pop(scanner_id, None)
+
+    def known_gate(self, gate):
+        """``gate`` if a scanner registered at it, else OTHER
+
+        Scans name their own gate, so only names scanners registered with
+        are kept apart; None (no gate) is passed through.
+        """
+        if gate is None or gate in self._registered_gates:
+            return gate
+        return OTHER
+
+    def scanner_count(self):
+        return len(self._scanners)
+
+    def record(self, gate, valid, queue_seconds=None, now=None):
+        """Count one scan; ``queue_seconds`` is how long it waited to reach the server"""
+        now = time.monotonic() if now is None else now
+        start = now - now % self.bucket
+        with self._lock:
+            window = self._gate(gate or UNASSIGNED)
+            if window.first_seen is None:
+                window.first_seen = now
+            if not window.buckets or window.buckets[-1][0] != start:
+                window.buckets.append([start, 0, 0, 0.0, 0])
+                self._prune(window, now)
+            counts = window.buckets[-1]
+            counts[1] += 1
+            counts[2] += 1 if valid else 0
+            if queue_seconds is not None:
+                counts[3] += queue_seconds
+                counts[4] += 1
+            window.last_scan = now
+
+    def snapshot(self, now=None):
+        """Per-gate rates over the rolling window, ordered by gate name"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            scanners = {}
+            for gate in self._scanners.values():
+                scanners[gate] = scanners.get(gate, 0) + 1
+            gates = []
+            for gate, window in sorted(self._gates.items()):
+                self._prune(window, now)
+                scans = sum(counts[1] for counts in window.buckets)
+                valid = sum(counts[2] for counts in window.buckets)
+                queue_total = sum(counts[3] for counts in window.buckets)
+                queue_samples = sum(counts[4] for counts in window.buckets)
+                # A gate that started scanning a minute ago is rated over that minute
+                seen = now - window.first_seen if window.first_seen is not None else 0
+                minutes = max(min(self.window, seen), self.bucket) / 60
+                gate_scanners = scanners.get(gate, 0)
+                gates.append({
+                    'gate': gate,
+                    'scanners': gate_scanners,
+                    'scans': scans,
+                    'scans_per_minute': round(scans / minutes, 1),
+                    'scans_per_minute_per_scanner': round(scans / minutes / gate_scanners, 1) if gate_scanners else None,
+                    'valid_ratio': round(valid / scans, 3) if scans else None,
+                    'avg_queue_seconds': round(queue_total / queue_samples, 1) if queue_samples else None,
+                    'seconds_since_last_scan': round(now - window.last_scan) if window.last_scan is not None else None
+                })
+        return gates
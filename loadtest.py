@@ -0,0 +1,231 @@
+"""Simulate a gate rush against a running ticket server.
+
+Starts N scanner clients that log in through /login, open a Socket.IO
+connection like the scanner page and then verify scans at a combined
+target rate, mixing first scans, duplicate scans and unknown ticket IDs.
+Scans go over the socket's ``verify`` event like the scanner page, or to
+/verify with ``--transport http``:
+
+    python loadtest.py --url http://localhost:5000 --scanners 20 --rate 100 --duration 60
+
+Tickets must be uploaded and generated first. Latency is measured from
+the moment each scan was due, so a server that falls behind shows up in
+the tail latency instead of silently lowering the request rate. Needs the
+Socket.IO client transports: pip install requests websocket-client
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+
+from benchmark import print_results, summarize
+
+try:
+    import requests
+    import socketio
+except ImportError as e:
+    requests = socketio = None
+    MISSING_DEPENDENCY = e
+else:
+    MISSING_DEPENDENCY = None
+
+
+def login(base_url, username, password):
+    """Return an HTTP session logged in as ``username``"""
+    http = requests.Session()
+    response = http.post(f'{base_url}/login', data={'username': username, 'password': password},
+                         allow_redirects=False, timeout=10)
+    if response.status_code != 302 or not http.cookies:
+        raise RuntimeError(f'Login failed for {username}')
+    return http
+
+
+def fetch_ticket_ids(base_url, username, password, limit=None):
+    """Page through /tickets as an admin and return the tickets' QR payloads"""
+    http = login(base_url, username, password)
+    ticket_ids = []
+    cursor = 0
+    while cursor is not None and (limit is None or len(ticket_ids) < limit):
+        data = http.get(f'{base_url}/tickets', params={'cursor': cursor, 'limit': 500}, timeout=30).json()
+        if not data.get('success'):
+            raise RuntimeError(f"Could not list tickets: {data.get('message')}")
+        # Scan what the QR codes encode, signed or not
+        ticket_ids += [ticket.get('qr_payload', ticket['ticket_id']) for ticket in data['tickets']]
+        cursor = data['next_cursor']
+    return ticket_ids[:limit]
+
+
+class ScanMix:
+    """Thread-safe source of ticket IDs to scan
+
+    Each draw is an unknown ID with probability ``invalid``, a ticket that
+    was already handed out with probability ``duplicate``, and otherwise a
+    ticket not scanned yet (falling back to a duplicate once all are used).
+    """
+
+    def __init__(self, ticket_ids, duplicate=0.1, invalid=0.05, seed=None):
+        self._unused = list(ticket_ids)
+        self._used = []
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._random.shuffle(self._unused)
+        self.duplicate = duplicate
+        self.invalid = invalid
+
+    def next(self):
+        with self._lock:
+            roll = self._random.random()
+            if roll < self.invalid:
+                return str(uuid.uuid4())
+            if self._used and (roll < self.invalid + self.duplicate or not self._unused):
+                return self._random.choice(self._used)
+            if not self._unused:
+                return str(uuid.uuid4())
+            ticket_id = self._unused.pop()
+            self._used.append(ticket_id)
+            return ticket_id
+
+
+class SimulatedScanner(threading.Thread):
+    """One scanner device: logs in, connects its socket and scans at a fixed rate"""
+
+    def __init__(self, index, base_url, credentials, mix, rate, duration, start_at, transport='socket'):
+        super().__init__(daemon=True)
+        self.index = index
+        self.base_url = base_url
+        self.credentials = credentials
+        self.mix = mix
+        self.interval = 1 / rate
+        self.duration = duration
+        self.start_at = start_at
+        self.transport = transport
+        self.gate = f'load-{index}'
+        self.latencies = []
+        self.outcomes = {}
+        self.errors = 0
+        self.socket_connected = False
+        self.events_received = 0
+        self.finished_at = None
+
+    def count(self, outcome):
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def run(self):
+        try:
+            http = login(self.base_url, *self.credentials)
+            http.get(f'{self.base_url}/scanner', timeout=10)
+            sio = socketio.Client(reconnection=False, http_session=http)
+            sio.on('*', self.on_event)
+            sio.connect(self.base_url, transports=['websocket'], wait_timeout=10)
+            sio.call('register_scanner', {'gate': self.gate}, timeout=10)
+            self.socket_connected = True
+        except Exception as e:
+            print(f'Scanner {self.index} could not connect: {e}', file=sys.stderr)
+            return
+
+        try:
+            self.scan(http, sio)
+        finally:
+            self.finished_at = time.perf_counter()
+            sio.disconnect()
+
+    def on_event(self, event, *args):
+        self.events_received += 1
+
+    def verify(self, http, sio, scan):
+        if self.transport == 'socket':
+            return sio.call('verify', scan, timeout=30)
+        response = http.post(f'{self.base_url}/verify', json=scan, timeout=30)
+        return response.json() if response.status_code == 200 else {}
+
+    def scan(self, http, sio):
+        # Stagger the scanners so their requests do not all line up
+        due = self.start_at + self.interval * random.random()
+        end = self.start_at + self.duration
+        while due < end:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            scan = {'ticket_id': self.mix.next(), 'gate': self.gate, 'scan_time': datetime.datetime.now().isoformat()}
+            try:
+                result = self.verify(http, sio, scan) or {}
+            except (requests.RequestException, socketio.exceptions.SocketIOError, ValueError):
+                result = {}
+            self.latencies.append(time.perf_counter() - due)
+            if result.get('success'):
+                self.count(result['data']['status'])
+            else:
+                self.errors += 1
+                self.count('error')
+            due += self.interval
+
+
+def run_load_test(base_url, scanners=10, rate=50, duration=30, duplicate=0.1, invalid=0.05,
+                  admin=('admin', 'admin'), scanner=('scanner', 'scanner'), max_tickets=None, transport='socket'):
+    """Run the simulated rush and return (result row, outcome counts, socket stats)"""
+    if MISSING_DEPENDENCY is not None:
+        raise RuntimeError(f'Load testing needs the Socket.IO client transports: {MISSING_DEPENDENCY}')
+    base_url = base_url.rstrip('/')
+    ticket_ids = fetch_ticket_ids(base_url, *admin, limit=max_tickets)
+    if not ticket_ids:
+        raise RuntimeError('No tickets on the server; upload and generate tickets first')
+
+    mix = ScanMix(ticket_ids, duplicate, invalid)
+    start_at = time.perf_counter() + 2
+    clients = [SimulatedScanner(i, base_url, scanner, mix, rate / scanners, duration, start_at, transport)
+               for i in range(scanners)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    finished = [client.finished_at for client in clients if client.finished_at is not None]
+    elapsed = max(max(finished, default=start_at) - start_at, 1e-9)
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    outcomes = {}
+    for client in clients:
+        for outcome, count in client.outcomes.items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+    result = summarize(f'verify {transport}', latencies, sum(client.errors for client in clients), elapsed)
+    result['target_rate'] = rate
+    result['error_rate'] = result['errors'] / result['requests'] if result['requests'] else 0.0
+    sockets = {
+        'connected': sum(client.socket_connected for client in clients),
+        'scanners': scanners,
+        'events_received': sum(client.events_received for client in clients)
+    }
+    return result, outcomes, sockets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate many scanners against a running ticket server')
+    parser.add_argument('--url', default='http://localhost:5000', help='server base URL')
+    parser.add_argument('--scanners', type=int, default=10, help='simulated scanner devices')
+    parser.add_argument('--rate', type=float, default=50, help='target scans per second, all scanners combined')
+    parser.add_argument('--duration', type=float, default=30, help='seconds to run')
+    parser.add_argument('--duplicate', type=float, default=0.1, help='share of scans repeating a scanned ticket')
+    parser.add_argument('--invalid', type=float, default=0.05, help='share of scans with unknown ticket IDs')
+    parser.add_argument('--transport', choices=['socket', 'http'], default='socket',
+                        help='verify over the Socket.IO connection or with HTTP requests')
+    parser.add_argument('--max-tickets', type=int, help='only use this many tickets from the server')
+    parser.add_argument('--admin', default='admin:admin', help='admin username:password, to list tickets')
+    parser.add_argument('--scanner', default='scanner:scanner', help='scanner username:password')
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    result, outcomes, sockets = run_load_test(
+        args.url, args.scanners, args.rate, args.duration, args.duplicate, args.invalid,
+        tuple(args.admin.split(':', 1)), tuple(args.scanner.split(':', 1)), args.max_tickets, args.transport)
+    print_results([result])
+    print(f"target {result['target_rate']:.1f} scans/s, achieved {result['throughput']:.1f} scans/s, "
+          f"error rate {result['error_rate']:.2%}")
+    print('outcomes: ' + ', '.join(f'{outcome} {count}' for outcome, count in sorted(outcomes.items())))
+    print(f"sockets connected: {sockets['connected']}/{sockets['scanners']}, "
+          f"events received: {sockets['events_received']}")
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({'result': result, 'outcomes': outcomes, 'sockets': sockets}, file, indent=2)
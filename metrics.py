@@ -0,0 +1,138 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms are defined where they are measured and register
+themselves in REGISTRY; render() produces the body served by /metrics.
+Values are per process, so scrape every server process separately.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+
+from server_mode import native_lock
+
+# Latency buckets in seconds, fine-grained at the sub-millisecond end
+# where ticket lookups land
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Observed from threadpool threads too
+        self._lock = native_lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(value) for value in labels)
+
+    def discard(self, **labels):
+        """Drop every series with the given label values"""
+        match = [(self.labelnames.index(name), str(value)) for name, value in labels.items()]
+        with self._lock:
+            for key in [key for key in self._values if all(key[index] == value for index, value in match)]:
+                del self._values[key]
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+        lines += [f'{name}{labels} {value}' for name, labels, value in self._samples()]
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count, per label values"""
+
+    type_name = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}_total', _label_text(self.labelnames, key), _number(value)
+
+
+class Histogram(Metric):
+    """Distribution of observed values (e.g. durations in seconds)"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # Per-bucket counts (last one is +Inf), then sum and count
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of the ``with`` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels):
+        counts = self._values.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def _samples(self):
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _label_text(self.labelnames, key, [('le', _number(bound))])
+                yield f'{self.name}_bucket', labels, str(cumulative)
+            yield f'{self.name}_sum', _label_text(self.labelnames, key), _number(counts[-2])
+            yield f'{self.name}_count', _label_text(self.labelnames, key), str(counts[-1])
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
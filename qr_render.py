@@ -0,0 +1,280 @@
+"""QR code rendering for ticket generation.
+
+Rendering and PNG-encoding a QR code is CPU bound, so large batches are
+fanned out over a process pool while results are returned in ticket order.
+A ticket's payload never changes, so rendered PNGs are also kept in an
+on-disk cache keyed by payload and render parameters.
+"""
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, RawIOBase
+
+import qrcode
+
+from server_mode import native_lock
+
+logger = logging.getLogger(__name__)
+
+# Worker processes used for QR rendering (defaults to one per CPU)
+QR_WORKERS = int(os.environ.get('QR_WORKERS', os.cpu_count() or 1))
+
+# Batches smaller than this are rendered in-process; the pool round-trip
+# costs more than it saves
+MIN_PARALLEL_BATCH = 50
+
+# Parameters every QR code is rendered with; part of the cache key
+RENDER_PARAMS = {
+    'error_correction': qrcode.constants.ERROR_CORRECT_M,
+    'box_size': 10,
+    'border': 4
+}
+
+QR_CACHE_DIR = os.path.join('uploads', 'qr_cache')
+# Cache size limit in bytes; 0 disables the cache
+QR_CACHE_MAX_BYTES = int(os.environ.get('QR_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+_executor = None
+# Rendering runs in gevent's threadpool in gevent mode
+_executor_lock = native_lock()
+_cache = None
+_cache_lock = native_lock()
+
+
+class QRCache:
+    """Size-bounded on-disk cache of rendered QR PNGs
+
+    Entries are named by a hash of the payload and RENDER_PARAMS. Reads
+    touch the file's mtime so eviction removes the least recently used
+    entries once the cache grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = native_lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith('.png'):
+                        yield entry.path
+
+    def path_for(self, payload):
+        digest = qr_etag(payload)
+        return os.path.join(self.directory, digest[:2], digest + '.png')
+
+    def contains(self, payload):
+        return os.path.exists(self.path_for(payload))
+
+    def get(self, payload):
+        path = self.path_for(payload)
+        try:
+            with open(path, 'rb') as file:
+                png = file.read()
+            os.utime(path)
+            return png
+        except OSError:
+            return None
+
+    def put(self, payload, png):
+        path = self.path_for(payload)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(png)
+        with self._lock:
+            # Another thread may have cached the same payload meanwhile
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, path)
+            self.size += len(png)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its limit"""
+        entries = sorted(self._entries(), key=lambda path: os.stat(path).st_mtime)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for path in entries:
+            if self.size <= target:
+                break
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            removed += 1
+        logger.info(f"Evicted {removed} QR codes from cache")
+
+
+def get_cache():
+    """Return the shared QR cache, or None when caching is disabled"""
+    global _cache
+    if QR_CACHE_MAX_BYTES <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = QRCache(QR_CACHE_DIR, QR_CACHE_MAX_BYTES)
+        return _cache
+
+
+def render_qr_png(payload):
+    """Render one QR code and return it as PNG bytes"""
+    img = qrcode.make(payload, **RENDER_PARAMS)
+    buffered = BytesIO()
+    img.save(buffered, format='PNG')
+    return buffered.getvalue()
+
+
+def get_executor():
+    """Return the shared rendering pool, starting it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=QR_WORKERS)
+            logger.info(f"Started QR rendering pool with {QR_WORKERS} workers")
+        return _executor
+
+
+def start_workers():
+    """Fork the rendering pool's worker processes now
+
+    Under gevent, processes can only be forked from the main event loop
+    thread, not from the threadpool that rendering later runs on.
+    """
+    if QR_WORKERS > 1:
+        get_executor().submit(int).result()
+
+
+def _render_uncached(payloads):
+    if QR_WORKERS <= 1 or len(payloads) < MIN_PARALLEL_BATCH:
+        return [render_qr_png(payload) for payload in payloads]
+
+    chunksize = max(1, len(payloads) // (QR_WORKERS * 4))
+    return list(get_executor().map(render_qr_png, payloads, chunksize=chunksize))
+
+
+def render_qr_pngs(payloads):
+    """Render QR codes for all payloads, returning PNG bytes in input order
+
+    Cached images are reused; only cache misses are rendered.
+    """
+    payloads = list(payloads)
+    cache = get_cache()
+    if cache is None:
+        return _render_uncached(payloads)
+
+    images = [cache.get(payload) for payload in payloads]
+    missing = [i for i, image in enumerate(images) if image is None]
+    if missing:
+        rendered = _render_uncached([payloads[i] for i in missing])
+        for i, png in zip(missing, rendered):
+            images[i] = png
+            cache.put(payloads[i], png)
+        logger.info(f"Rendered {len(missing)} QR codes, {len(payloads) - len(missing)} from cache")
+    return images
+
+
+def get_qr_png(payload):
+    """Return the PNG for one payload, rendering and caching it on a miss"""
+    cache = get_cache()
+    png = cache.get(payload) if cache is not None else None
+    if png is None:
+        png = render_qr_png(payload)
+        if cache is not None:
+            cache.put(payload, png)
+    return png
+
+
+def qr_etag(payload):
+    """Stable ETag for a payload's QR image under the current RENDER_PARAMS"""
+    params = ','.join(f'{name}={value}' for name, value in sorted(RENDER_PARAMS.items()))
+    return hashlib.sha256(f'{params}|{payload}'.encode('utf-8')).hexdigest()
+
+
+def warm_cache(payloads, batch_size=1000):
+    """Render uncached payloads into the cache in bounded batches
+
+    Returns the number of QR codes rendered. Images are written to the
+    cache rather than returned, so memory stays bounded by ``batch_size``.
+    """
+    cache = get_cache()
+    if cache is None:
+        return 0
+
+    rendered = 0
+    batch = []
+    for payload in payloads:
+        if not cache.contains(payload):
+            batch.append(payload)
+        if len(batch) >= batch_size:
+            for missing, png in zip(batch, _render_uncached(batch)):
+                cache.put(missing, png)
+            rendered += len(batch)
+            batch = []
+    if batch:
+        for missing, png in zip(batch, _render_uncached(batch)):
+            cache.put(missing, png)
+        rendered += len(batch)
+    return rendered
+
+
+class _ChunkWriter(RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_qr_zip(entries, batch_size=200):
+    """Stream a ZIP archive of QR PNGs for (filename, payload) entries
+
+    Entries are rendered a batch at a time and each batch is yielded as
+    soon as it is written, so only one batch of images is held in memory.
+    PNG data is already compressed, so members are stored, not deflated.
+    """
+    sink = _ChunkWriter()
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                for (filename, _), png in zip(batch, render_qr_pngs(payload for _, payload in batch)):
+                    archive.writestr(filename, png)
+                batch = []
+                yield sink.take()
+        for (filename, _), png in zip(batch, render_qr_pngs(payload for _, payload in batch)):
+            archive.writestr(filename, png)
+    yield sink.take()
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
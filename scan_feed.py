@@ -0,0 +1,66 @@
+"""Recent scans feed for the admin dashboard."""
+import threading
+import uuid
+from collections import deque
+from itertools import islice
+
+
+class RecentScans:
+    """Fixed-capacity, thread-safe ring buffer of the latest scans
+
+    Every scan added gets an increasing ``id`` and the feed's ``source``.
+    Ids are only unique within one feed, so clients that merge scans from
+    several server processes key them by both. Readers pass the last id
+    they have seen and get only newer scans, optionally for one gate, so
+    polling dashboards never re-fetch the whole feed.
+    """
+
+    def __init__(self, capacity):
+        self._scans = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self.source = uuid.uuid4().hex[:12]
+
+    @property
+    def capacity(self):
+        return self._scans.maxlen
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def add(self, scan_data):
+        """Append a scan, stamping it with the next id and the feed's source"""
+        with self._lock:
+            self._last_id += 1
+            scan_data['id'] = self._last_id
+            scan_data['source'] = self.source
+            self._scans.append(scan_data)
+        return scan_data
+
+    def since(self, after_id=0, gate=None, limit=None):
+        """Return (scans after ``after_id``, oldest first; cursor)
+
+        With a ``limit`` at most ``limit`` matching scans are returned and
+        the cursor is the id of the last scan read, so the next call picks
+        up right after it. Scans that have been overwritten are skipped.
+        """
+        with self._lock:
+            if after_id > self._last_id:
+                # Cursor from before a server restart
+                after_id = 0
+            first_id = self._last_id - len(self._scans) + 1
+            start = max(after_id - first_id + 1, 0)
+            pending = list(islice(self._scans, start, None))
+        cursor = pending[-1]['id'] if pending else after_id
+        scans = []
+        for scan in pending:
+            if limit is not None and len(scans) >= limit:
+                cursor = scans[-1]['id'] if scans else after_id
+                break
+            if not gate or scan.get('gate') == gate:
+                scans.append(scan)
+        return scans, cursor
+
+    def __len__(self):
+        return len(self._scans)
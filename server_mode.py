@@ -0,0 +1,70 @@
+"""Concurrency mode for the ticket server.
+
+``ASYNC_MODE`` selects how app_simple.py serves requests:
+
+- ``threading`` (default): Werkzeug server, one thread per connection
+- ``gevent``: gevent WSGI server, so one process holds thousands of
+  websocket connections and concurrent requests as greenlets
+
+gevent mode monkey patches the standard library when this module is
+imported, so it must be imported before anything else. Blocking disk and
+SQLite work is then handed to gevent's native threadpool through
+run_blocking() so it never stalls the event loop. Locks used by that work
+must come from native_lock().
+"""
+import os
+import threading
+
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+elif ASYNC_MODE != 'threading':
+    raise ValueError(f"Unsupported ASYNC_MODE: {ASYNC_MODE}")
+
+
+def native_lock(reentrant=False):
+    """An OS-level lock, even when threading is monkey patched
+
+    gevent's patched locks deadlock when contended from its threadpool's
+    native threads, so every lock taken by code run through run_blocking()
+    must be native. Never hold one across a call that yields to other
+    greenlets, e.g. run_blocking() itself.
+    """
+    if ASYNC_MODE == 'gevent':
+        # threading's own factories build on the patched _thread module
+        return monkey.get_original('_thread', 'RLock' if reentrant else 'allocate_lock')()
+    return threading.RLock() if reentrant else threading.Lock()
+
+
+def start_native_thread(func, *args):
+    """Run ``func`` in the background in an OS thread, even under gevent"""
+    if ASYNC_MODE == 'gevent':
+        monkey.get_original('_thread', 'start_new_thread')(func, args)
+    else:
+        threading.Thread(target=func, args=args, daemon=True).start()
+
+
+def run_blocking(func, *args, **kwargs):
+    """Call ``func`` off the event loop and wait for its result"""
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args, kwargs)
+    return func(*args, **kwargs)
+
+
+def iter_blocking(iterable):
+    """Iterate a blocking iterable, producing each item off the event loop"""
+    iterator = iter(iterable)
+    done = object()
+    try:
+        while True:
+            item = run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            close()
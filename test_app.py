@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import csv
+import os
 import uuid
 import datetime
 import qrcode
@@ -58,6 +59,947 @@ def test_csv_operations():
     
     return True
 
+def test_ticket_store_index():
+    """Test that the ticket store indexes rows by UUID"""
+    print("Testing ticket store index...")
+    from ticket_store import CsvTicketStore, journal_path_for
+    
+    ticket_ids = [str(uuid.uuid4()) for _ in range(3)]
+    with open('test_store.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid', 'scanned', 'scan_time'])
+        writer.writeheader()
+        for i, ticket_id in enumerate(ticket_ids):
+            writer.writerow({'name': f'Guest {i}', 'email': f'guest{i}@example.com',
+                             'uuid': ticket_id, 'scanned': 'False', 'scan_time': ''})
+    
+    store = CsvTicketStore('test_store.csv')
+    assert len(store) == 3
+    assert store.get(ticket_ids[1])['name'] == 'Guest 1'
+    assert store.get(str(uuid.uuid4())) is None
+    print("✅ Ticket lookup by UUID works")
+    
+    store.check_in(ticket_ids[0], '2025-01-01 10:00:00')
+    store.save()
+    assert CsvTicketStore('test_store.csv').get(ticket_ids[0])['scanned'] == 'True'
+    print("✅ Ticket store persisted to CSV")
+    
+    store.close()
+    os.remove('test_store.csv')
+    os.remove(journal_path_for('test_store.csv'))
+    return True
+
+def test_compact_ticket_rows():
+    """Test that compactly stored tickets round-trip exactly"""
+    print("Testing compact ticket storage...")
+    from ticket_store import CsvTicketStore, journal_path_for
+    
+    ticket_ids = [str(uuid.uuid4()), str(uuid.uuid4()).upper(), 'VIP-0001']
+    with open('test_compact.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name', 'email', 'notes', 'uuid'])
+        writer.writerow(['Zoë Ünal', 'zoe@example.com', 'a\x1fb', ticket_ids[0]])
+        writer.writerow(['Guest, Jr.', 'guest@example.com', '', ticket_ids[1]])
+        writer.writerow(['Custom', 'custom@example.com', 'line\nbreak', ticket_ids[2]])
+        writer.writerow(['No ID', 'noid@example.com', '', ''])
+    
+    store = CsvTicketStore('test_compact.csv', fresh=True, fsync=False)
+    assert len(store._keys[0]) == 16
+    assert store.get(ticket_ids[0]) == {'name': 'Zoë Ünal', 'email': 'zoe@example.com', 'notes': 'a\x1fb',
+                                        'uuid': ticket_ids[0], 'scanned': 'False', 'scan_time': ''}
+    assert store.get(ticket_ids[1])['name'] == 'Guest, Jr.'
+    assert store.get(ticket_ids[2])['notes'] == 'line\nbreak'
+    assert store.get(ticket_ids[1].lower()) is None
+    print("✅ UUIDs, custom IDs and column values preserved")
+    
+    row, admitted = store.check_in(ticket_ids[2], '2025-01-01 10:00:00')
+    assert admitted and row['scanned'] == 'True'
+    store.assign_ticket_ids()
+    store.close()
+    reloaded = CsvTicketStore('test_compact.csv', fsync=False)
+    assert [row['uuid'] for row in reloaded.rows][:3] == ticket_ids
+    assert reloaded.rows[3]['uuid'] and reloaded.get(ticket_ids[2])['scan_time'] == '2025-01-01 10:00:00'
+    print("✅ Compact tickets saved and reloaded")
+    
+    reloaded.close()
+    os.remove('test_compact.csv')
+    os.remove(journal_path_for('test_compact.csv'))
+    return True
+
+def test_scan_journal_replay():
+    """Test that check-ins are journalled and replayed on reload"""
+    print("Testing scan journal...")
+    from ticket_store import CsvTicketStore, journal_path_for
+    
+    ticket_ids = [str(uuid.uuid4()) for _ in range(3)]
+    with open('test_journal.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid', 'scanned', 'scan_time'])
+        writer.writeheader()
+        for i, ticket_id in enumerate(ticket_ids):
+            writer.writerow({'name': f'Guest {i}', 'email': f'guest{i}@example.com',
+                             'uuid': ticket_id, 'scanned': 'False', 'scan_time': ''})
+    
+    store = CsvTicketStore('test_journal.csv', fresh=True, fsync=False)
+    store.check_in(ticket_ids[2], '2025-01-01 10:00:00')
+    store.journal.close()
+    
+    # The CSV is untouched until compaction; the journal carries the scan
+    with open('test_journal.csv', 'r', encoding='utf-8') as file:
+        assert 'True' not in file.read()
+    reloaded = CsvTicketStore('test_journal.csv', fsync=False)
+    assert reloaded.get(ticket_ids[2])['scan_time'] == '2025-01-01 10:00:00'
+    print("✅ Check-in replayed from journal")
+    
+    reloaded.compact()
+    reloaded.close()
+    assert os.path.getsize(journal_path_for('test_journal.csv')) == 0
+    assert CsvTicketStore('test_journal.csv').get(ticket_ids[2])['scanned'] == 'True'
+    print("✅ Journal compacted into CSV")
+    
+    import time
+    import ticket_store
+    compact_every = ticket_store.COMPACT_EVERY
+    ticket_store.COMPACT_EVERY = 1
+    try:
+        store = CsvTicketStore('test_journal.csv', fsync=False)
+        store._compact_lock.acquire()
+        # The scan path only rotates the journal; compaction waits its turn
+        store.check_in(ticket_ids[0], '2025-01-01 11:00:00')
+        store.journal.close()
+        assert os.path.exists(store.journal.rotated_path)
+        reloaded = CsvTicketStore('test_journal.csv', fsync=False)
+        assert reloaded.get(ticket_ids[0])['scanned'] == 'True'
+        reloaded.journal.close()
+        store._compact_lock.release()
+        for _ in range(100):
+            if not store._compacting:
+                break
+            time.sleep(0.05)
+        assert not os.path.exists(store.journal.rotated_path)
+        with open('test_journal.csv', 'r', encoding='utf-8') as file:
+            assert '2025-01-01 11:00:00' in file.read()
+        store.close()
+    finally:
+        ticket_store.COMPACT_EVERY = compact_every
+    print("✅ Journal rotated and compacted in the background")
+    
+    os.remove('test_journal.csv')
+    os.remove(journal_path_for('test_journal.csv'))
+    return True
+
+def test_concurrent_check_in():
+    """Test that concurrent scans of one ticket admit it exactly once"""
+    print("Testing concurrent check-in...")
+    import threading
+    from ticket_store import CsvTicketStore, journal_path_for
+    
+    ticket_id = str(uuid.uuid4())
+    with open('test_concurrent.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid', 'scanned', 'scan_time'])
+        writer.writeheader()
+        writer.writerow({'name': 'Guest', 'email': 'guest@example.com',
+                         'uuid': ticket_id, 'scanned': 'False', 'scan_time': ''})
+    
+    store = CsvTicketStore('test_concurrent.csv', fresh=True, fsync=False)
+    results = []
+    barrier = threading.Barrier(16)
+    
+    def scan():
+        barrier.wait()
+        results.append(store.check_in(ticket_id, '2025-01-01 10:00:00')[1])
+    
+    threads = [threading.Thread(target=scan) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results.count(True) == 1
+    assert store.check_in(str(uuid.uuid4()), '2025-01-01 10:00:00') == (None, False)
+    print("✅ Ticket admitted exactly once across 16 scanners")
+    
+    store.close()
+    os.remove('test_concurrent.csv')
+    os.remove(journal_path_for('test_concurrent.csv'))
+    return True
+
+GEVENT_CHECK_IN_SCRIPT = """
+import csv, os, sys, uuid
+from server_mode import run_blocking
+import gevent
+from ticket_store import CsvTicketStore
+
+path = sys.argv[1]
+ticket_ids = [str(uuid.uuid4()) for _ in range(50)]
+with open(path, 'w', newline='', encoding='utf-8') as file:
+    writer = csv.writer(file)
+    writer.writerow(['name', 'email', 'uuid', 'scanned', 'scan_time'])
+    writer.writerows(['Guest', 'guest@example.com', ticket_id, 'False', ''] for ticket_id in ticket_ids)
+store = CsvTicketStore(path, fresh=True, fsync=False)
+jobs = [gevent.spawn(run_blocking, store.check_in, ticket_ids[i % 50], '2025-01-01 10:00:00') for i in range(1000)]
+gevent.joinall(jobs, timeout=30)
+results = [job.value for job in jobs if job.successful()]
+store.close()
+print(len(results), sum(admitted for _, admitted in results))
+"""
+
+def test_gevent_concurrent_check_in():
+    """Test contended check-ins offloaded to gevent's threadpool"""
+    print("Testing concurrent check-in under gevent...")
+    import subprocess
+    import sys
+    from ticket_store import journal_path_for
+    
+    try:
+        import gevent  # noqa: F401
+    except ImportError:
+        print("⚠️ gevent not installed, skipped")
+        return True
+    
+    # Monkey patching has to happen in a fresh interpreter
+    env = dict(os.environ, ASYNC_MODE='gevent',
+               PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                         os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-c', GEVENT_CHECK_IN_SCRIPT, 'test_gevent.csv'],
+                            env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['1000', '50'], result.stdout
+    print("✅ 1000 greenlets checked in 50 tickets without deadlocking")
+    
+    for path in ['test_gevent.csv', journal_path_for('test_gevent.csv')]:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+def test_sqlite_store():
+    """Test the SQLite ticket store backend"""
+    print("Testing SQLite ticket store...")
+    from ticket_store import open_store, SqliteTicketStore
+    
+    with open('test_sqlite.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email', 'ticket_type'])
+        writer.writeheader()
+        writer.writerow({'name': 'Guest 0', 'email': 'guest0@example.com', 'ticket_type': 'VIP'})
+        writer.writerow({'name': 'Guest 1', 'email': 'guest1@example.com', 'ticket_type': 'Standard'})
+    
+    store = open_store('test_sqlite.csv', backend='sqlite', fresh=True)
+    assert len(store) == 2
+    store.assign_ticket_ids()
+    ticket_id = store.rows[1]['uuid']
+    assert store.get(ticket_id)['ticket_type'] == 'Standard'
+    
+    row, admitted = store.check_in(ticket_id, '2025-01-01 10:00:00')
+    assert admitted and row['scanned'] == 'True'
+    assert store.check_in(ticket_id, '2025-01-01 10:05:00') == (row, False)
+    print("✅ SQLite check-in admits a ticket once")
+    
+    store.export_csv('test_sqlite_export.csv')
+    with open('test_sqlite_export.csv', 'r', encoding='utf-8') as file:
+        exported = list(csv.DictReader(file))
+    assert exported[1]['scan_time'] == '2025-01-01 10:00:00'
+    assert exported[0]['scanned'] == 'False'
+    print("✅ SQLite store exported to CSV")
+    
+    # A second process opening the same database shares counters and state
+    other = SqliteTicketStore('test_sqlite.db')
+    other.counters.record_invalid()
+    other.counters.record_rejected()
+    assert other.ticket_set_id == store.ticket_set_id
+    assert store.counters.snapshot()['invalid'] == 2 and store.counters.snapshot()['rejected'] == 1
+    assert other.counters.snapshot()['valid'] == 1
+    assert other.check_in(ticket_id, '2025-01-01 10:10:00')[1] is False
+    assert other.counters.scanned_since(0) == ([ticket_id], 1)
+    print("✅ SQLite counters shared between store instances")
+    
+    import threading
+    from ticket_store import SQLITE_POOL_SIZE
+    threads = [threading.Thread(target=store.get, args=(ticket_id,)) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store._idle) <= SQLITE_POOL_SIZE
+    print("✅ SQLite connections pooled across request threads")
+    
+    other.close()
+    store.close()
+    for path in ['test_sqlite.csv', 'test_sqlite_export.csv', 'test_sqlite.db',
+                 'test_sqlite.db-wal', 'test_sqlite.db-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+def test_merge_upload():
+    """Test merging a re-uploaded ticket list into both store backends"""
+    print("Testing merged re-upload...")
+    from ticket_store import open_store
+    
+    for backend in ['csv', 'sqlite']:
+        with open('test_merge.csv', 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=['name', 'email'])
+            writer.writeheader()
+            writer.writerow({'name': 'Guest 0', 'email': 'guest0@example.com'})
+            writer.writerow({'name': 'Parent', 'email': 'family@example.com'})
+            writer.writerow({'name': 'Child', 'email': 'family@example.com'})
+        
+        store = open_store('test_merge.csv', backend=backend, fresh=True)
+        store.assign_ticket_ids()
+        first, parent, child = [row['uuid'] for row in store.rows]
+        assert store.check_in(first, '2025-01-01 10:00:00')[1]
+        ticket_set = store.ticket_set_id
+        
+        with open('test_merge_upload.csv', 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid', 'seat'])
+            writer.writeheader()
+            writer.writerow({'name': 'Guest Zero', 'email': 'guest0@example.com', 'uuid': first, 'seat': 'A1'})
+            writer.writerow({'name': 'Parent', 'email': 'family@example.com', 'uuid': '', 'seat': ''})
+            writer.writerow({'name': 'Child', 'email': 'FAMILY@example.com', 'uuid': '', 'seat': 'B2'})
+            writer.writerow({'name': 'Late Guest', 'email': 'late@example.com', 'uuid': '', 'seat': ''})
+            writer.writerow({'name': 'Walk-in', 'email': 'walkin@example.com',
+                             'uuid': '11111111-2222-3333-4444-555555555555', 'seat': ''})
+        
+        assert store.merge_file('test_merge_upload.csv') == (2, 2, 1)
+        assert len(store) == 5
+        row = store.get(first)
+        assert row['name'] == 'Guest Zero' and row['seat'] == 'A1'
+        assert row['scanned'] == 'True' and row['scan_time'] == '2025-01-01 10:00:00'
+        assert store.get(parent)['name'] == 'Parent' and store.get(child)['seat'] == 'B2'
+        assert store.check_in('11111111-2222-3333-4444-555555555555', '2025-01-01 11:00:00')[1]
+        assert store.check_in(first, '2025-01-01 11:00:00')[1] is False
+        assert store.counters.snapshot()['total_tickets'] == 5
+        assert store.ticket_set_id != ticket_set
+        print(f"✅ {backend} merge keeps check-ins and matches by UUID or email")
+        
+        store.close()
+        reopened = open_store('test_merge.csv', backend=backend)
+        assert len(reopened) == 5 and reopened.get(first)['scanned'] == 'True'
+        assert sum(1 for row in reopened.rows if not row['uuid']) == 1
+        
+        import threading
+        import ticket_store
+        merge_chunk_size = ticket_store.MERGE_CHUNK_SIZE
+        ticket_store.MERGE_CHUNK_SIZE = 1
+        try:
+            def chunked_rows():
+                yield {'name': 'Parent', 'email': 'family@example.com', 'uuid': parent}
+                # Between chunks a check-in goes through without waiting for the merge
+                scan = threading.Thread(target=reopened.check_in, args=(parent, '2025-01-01 12:00:00'))
+                scan.start()
+                scan.join(5)
+                assert not scan.is_alive()
+                yield {'name': 'Child', 'email': 'FAMILY@example.com', 'uuid': child}
+            assert reopened.merge_rows(['name', 'email', 'uuid'], chunked_rows()) == (0, 0, 2)
+        finally:
+            ticket_store.MERGE_CHUNK_SIZE = merge_chunk_size
+        assert reopened.get(parent)['scanned'] == 'True'
+        reopened.close()
+    print("✅ Merged tickets persisted")
+    print("✅ Check-ins served between merge chunks")
+    
+    for path in ['test_merge.csv', 'test_merge_upload.csv', 'test_merge.journal', 'test_merge.db',
+                 'test_merge.db-wal', 'test_merge.db-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+def test_scan_counters():
+    """Test that stats counters are maintained on check-in"""
+    print("Testing incremental scan counters...")
+    from ticket_store import CsvTicketStore, journal_path_for
+    
+    ticket_ids = [str(uuid.uuid4()) for _ in range(3)]
+    with open('test_counters.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid', 'scanned', 'scan_time'])
+        writer.writeheader()
+        writer.writerow({'name': 'Guest 0', 'email': 'guest0@example.com', 'uuid': ticket_ids[0],
+                         'scanned': 'True', 'scan_time': '2020-01-01 09:00:00'})
+        for ticket_id in ticket_ids[1:]:
+            writer.writerow({'name': 'Guest', 'email': 'guest@example.com',
+                             'uuid': ticket_id, 'scanned': 'False', 'scan_time': ''})
+    
+    store = CsvTicketStore('test_counters.csv', fresh=True, fsync=False)
+    assert store.counters.snapshot() == {'total_tickets': 3, 'valid': 1, 'invalid': 0, 'rejected': 0,
+                                         'scanned_today': 0}
+    
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    store.check_in(ticket_ids[1], now)
+    store.check_in(ticket_ids[1], now)
+    store.counters.record_invalid()
+    store.counters.record_rejected()
+    assert store.counters.snapshot() == {'total_tickets': 3, 'valid': 2, 'invalid': 2, 'rejected': 1,
+                                         'scanned_today': 1}
+    print("✅ Counters updated once per admitted ticket")
+    
+    assert store.counters.scanned_since(0) == ([ticket_ids[0], ticket_ids[1]], 2)
+    store.check_in(ticket_ids[2], now)
+    assert store.counters.scanned_since(2) == ([ticket_ids[2]], 3)
+    print("✅ Checked-in ticket IDs available as deltas")
+    
+    store.close()
+    os.remove('test_counters.csv')
+    os.remove(journal_path_for('test_counters.csv'))
+    return True
+
+def test_parallel_qr_rendering():
+    """Test that pooled QR rendering keeps ticket order"""
+    print("Testing parallel QR rendering...")
+    import qr_render
+    
+    cache_max_bytes = qr_render.QR_CACHE_MAX_BYTES
+    qr_render.QR_CACHE_MAX_BYTES = 0
+    try:
+        ticket_ids = [str(uuid.uuid4()) for _ in range(qr_render.MIN_PARALLEL_BATCH)]
+        images = qr_render.render_qr_pngs(ticket_ids)
+        assert images == [qr_render.render_qr_png(ticket_id) for ticket_id in ticket_ids]
+        qr_render.shutdown()
+    finally:
+        qr_render.QR_CACHE_MAX_BYTES = cache_max_bytes
+    print(f"✅ Rendered {len(images)} QR codes in ticket order")
+    return True
+
+def test_qr_cache_eviction():
+    """Test that the QR cache returns stored images and evicts old ones"""
+    print("Testing QR cache...")
+    import shutil
+    import qr_render
+    
+    cache = qr_render.QRCache('test_qr_cache', max_bytes=1000)
+    cache.put('ticket-a', b'a' * 400)
+    assert cache.get('ticket-a') == b'a' * 400
+    assert cache.get('ticket-b') is None
+    print("✅ Cached QR image returned")
+    
+    os.utime(cache.path_for('ticket-a'), (0, 0))
+    cache.put('ticket-b', b'b' * 400)
+    cache.put('ticket-c', b'c' * 400)
+    assert cache.get('ticket-a') is None
+    assert cache.get('ticket-c') == b'c' * 400
+    assert cache.size <= 900
+    print("✅ Least recently used QR image evicted")
+    
+    import threading
+    size = cache.size
+    threads = [threading.Thread(target=cache.put, args=('ticket-d', b'd' * 50)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.size == size + 50
+    print("✅ Concurrent puts of one QR image counted once")
+    
+    shutil.rmtree('test_qr_cache')
+    return True
+
+def test_ticket_pages():
+    """Test cursor pagination over both store backends"""
+    print("Testing ticket pagination...")
+    from ticket_store import open_store, journal_path_for
+    
+    with open('test_pages.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email'])
+        writer.writeheader()
+        for i in range(7):
+            writer.writerow({'name': f'Guest {i}', 'email': f'guest{i}@example.com'})
+    
+    for backend in ['csv', 'sqlite']:
+        store = open_store('test_pages.csv', backend=backend, fresh=True)
+        names = []
+        rows, cursor = store.page(0, 3)
+        pages = 1
+        names += [row['name'] for row in rows]
+        while cursor is not None:
+            rows, cursor = store.page(cursor, 3)
+            pages += 1
+            names += [row['name'] for row in rows]
+        assert pages == 3
+        assert names == [f'Guest {i}' for i in range(7)]
+        assert [row['name'] for row in store.iter_rows(batch_size=2)] == names
+        assert store.page(-1, 3) == store.page(0, 3)
+        store.close()
+        print(f"✅ {backend} store paged in order")
+    
+    for path in ['test_pages.csv', journal_path_for('test_pages.csv'), 'test_pages.db',
+                 'test_pages.db-wal', 'test_pages.db-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+def test_streamed_ticket_zip():
+    """Test that the ticket ZIP export streams valid PNG members"""
+    print("Testing streamed ticket ZIP...")
+    import zipfile
+    import qr_render
+    
+    cache_max_bytes = qr_render.QR_CACHE_MAX_BYTES
+    qr_render.QR_CACHE_MAX_BYTES = 0
+    try:
+        ticket_ids = [str(uuid.uuid4()) for _ in range(5)]
+        chunks = list(qr_render.iter_qr_zip(((f'{ticket_id}.png', ticket_id) for ticket_id in ticket_ids),
+                                            batch_size=2))
+    finally:
+        qr_render.QR_CACHE_MAX_BYTES = cache_max_bytes
+    assert len(chunks) == 3
+    
+    archive = zipfile.ZipFile(BytesIO(b''.join(chunks)))
+    assert archive.namelist() == [f'{ticket_id}.png' for ticket_id in ticket_ids]
+    assert archive.read(f'{ticket_ids[0]}.png').startswith(b'\x89PNG')
+    print(f"✅ Streamed {len(ticket_ids)} tickets in {len(chunks)} chunks")
+    return True
+
+def test_streaming_import():
+    """Test importing ticket files with validation and UUID de-duplication"""
+    print("Testing streaming ticket import...")
+    from ticket_store import import_ticket_file
+    
+    ticket_id = str(uuid.uuid4())
+    with open('test_import.csv', 'w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid'])
+        writer.writeheader()
+        writer.writerow({'name': 'Guest 0', 'email': 'guest0@example.com', 'uuid': ticket_id})
+        writer.writerow({'name': 'Guest 1', 'email': 'guest1@example.com', 'uuid': ticket_id})
+        writer.writerow({'name': 'Guest 2', 'email': 'guest2@example.com', 'uuid': ''})
+    
+    assert import_ticket_file('test_import.csv', 'test_imported.csv') == (2, 1)
+    with open('test_imported.csv', 'r', encoding='utf-8') as file:
+        assert [row['name'] for row in csv.DictReader(file)] == ['Guest 0', 'Guest 2']
+    print("✅ Duplicate ticket IDs dropped on import")
+    
+    with open('test_import.csv', 'w', newline='', encoding='utf-8') as file:
+        file.write('name,phone\nGuest,555\n')
+    try:
+        import_ticket_file('test_import.csv', 'test_imported.csv')
+        assert False, 'missing email column was accepted'
+    except ValueError as e:
+        assert 'email' in str(e)
+    print("✅ Missing required columns rejected")
+    
+    try:
+        import openpyxl
+        assert import_ticket_file('dummy_tickets.xlsx', 'test_imported.csv') == (15, 0)
+        print("✅ XLSX ticket file imported")
+    except ImportError:
+        print("⚠️ openpyxl not available, skipped XLSX import")
+    
+    os.remove('test_import.csv')
+    os.remove('test_imported.csv')
+    return True
+
+def test_batch_check_in():
+    """Test that a batch of scans admits each ticket once, first scan first"""
+    print("Testing batch check-in...")
+    from ticket_store import open_store, journal_path_for
+    
+    ticket_ids = [str(uuid.uuid4()) for _ in range(2)]
+    
+    for backend in ['csv', 'sqlite']:
+        with open('test_batch.csv', 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=['name', 'email', 'uuid'])
+            writer.writeheader()
+            for i, ticket_id in enumerate(ticket_ids):
+                writer.writerow({'name': f'Guest {i}', 'email': f'guest{i}@example.com', 'uuid': ticket_id})
+        
+        store = open_store('test_batch.csv', backend=backend, fresh=True)
+        results = store.check_in_many([
+            (ticket_ids[0], '2025-01-01 10:00:00'),
+            (ticket_ids[0], '2025-01-01 10:01:00'),
+            ('unknown', '2025-01-01 10:02:00'),
+            (ticket_ids[1], '2025-01-01 10:03:00'),
+        ])
+        assert [admitted for _, admitted in results] == [True, False, False, True]
+        assert results[1][0]['scan_time'] == '2025-01-01 10:00:00'
+        assert results[2][0] is None
+        assert store.counters.snapshot()['valid'] == 2
+        store.close()
+        print(f"✅ {backend} batch admitted each ticket once")
+    
+    for path in ['test_batch.csv', journal_path_for('test_batch.csv'), 'test_batch.db',
+                 'test_batch.db-wal', 'test_batch.db-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+    return True
+
+def app_client_with_tickets(event_id, ticket_ids):
+    """Log in to app_simple as admin and upload the tickets to a test event"""
+    import app_simple
+    
+    client = app_simple.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    rows = ''.join(f'Guest {i},guest{i}@example.com,{ticket_id}\n' for i, ticket_id in enumerate(ticket_ids))
+    upload = BytesIO(('name,email,uuid\n' + rows).encode())
+    response = client.post(f'/upload_excel?event={event_id}', data={'file': (upload, 'tickets.csv')},
+                           content_type='multipart/form-data')
+    assert response.json['success'], response.json
+    return app_simple, client
+
+def remove_app_event(app_simple, event_id):
+    import shutil
+    app_simple.events.close_all()
+    shutil.rmtree(os.path.join(app_simple.EVENTS_FOLDER, event_id), ignore_errors=True)
+
+def test_verify_batch_route():
+    """Test that /verify_batch applies queued scans in client scan-time order"""
+    print("Testing /verify_batch...")
+    ticket_ids = [str(uuid.uuid4()) for _ in range(2)]
+    app_simple, client = app_client_with_tickets('test-verify-batch', ticket_ids)
+    
+    try:
+        # Listed out of order, as two offline scanners might upload them
+        response = client.post('/verify_batch', json={'scans': [
+            {'ticket_id': ticket_ids[0], 'scan_time': '2025-01-01T10:05:00', 'gate': 'North'},
+            {'ticket_id': 'unknown', 'scan_time': '2025-01-01T10:01:00'},
+            {'ticket_id': ticket_ids[0], 'scan_time': '2025-01-01T10:00:00', 'gate': 'South'},
+            {'ticket_id': ticket_ids[1], 'scan_time': '2025-01-01T10:02:00'},
+            {'gate': 'North'},
+        ]})
+        results = response.json['results']
+        assert [result.get('valid') for result in results] == [False, False, True, True, None]
+        assert results[0]['message'] == 'Ticket already scanned'
+        assert results[0]['data']['scan_time'] == '2025-01-01 10:00:00'
+        assert results[4]['message'] == 'No ticket ID provided'
+        print("✅ Earliest scan of a ticket wins, results in request order")
+        
+        for body in [None, [], {'scans': 'x'}, {'scans': []}]:
+            response = client.post('/verify_batch', json=body)
+            assert response.status_code == 400 and not response.json['success']
+        print("✅ Malformed batches answered with a JSON 400")
+    finally:
+        remove_app_event(app_simple, 'test-verify-batch')
+    return True
+
+def test_socket_verify_ack():
+    """Test that the verify Socket.IO event answers with the /verify result"""
+    print("Testing socket verify...")
+    ticket_ids = [str(uuid.uuid4())]
+    app_simple, client = app_client_with_tickets('test-socket-verify', ticket_ids)
+    
+    try:
+        socket = app_simple.socketio.test_client(app_simple.app, flask_test_client=client)
+        assert socket.is_connected()
+        ack = socket.emit('verify', {'ticket_id': ticket_ids[0], 'gate': 'North'}, callback=True)
+        assert ack['valid'] and ack['data']['ticket_id'] == ticket_ids[0]
+        ack = socket.emit('verify', {'ticket_id': ticket_ids[0]}, callback=True)
+        assert not ack['valid'] and ack['message'] == 'Ticket already scanned'
+        assert socket.emit('verify', 'junk', callback=True) == {'success': False, 'message': 'No ticket ID provided'}
+        print("✅ Scan results returned as acks")
+        
+        socket.disconnect()
+        anonymous = app_simple.socketio.test_client(app_simple.app)
+        assert anonymous.emit('verify', {'ticket_id': ticket_ids[0]}, callback=True)['message'] == 'Unauthorized'
+        anonymous.disconnect()
+        print("✅ Logged out sockets refused")
+    finally:
+        remove_app_event(app_simple, 'test-socket-verify')
+    return True
+
+def test_require_signed_tickets():
+    """Test that REQUIRE_SIGNED_TICKETS admits only correctly signed codes"""
+    print("Testing required ticket signatures...")
+    import app_simple
+    from ticket_signing import TicketSigner
+    
+    ticket_ids = [str(uuid.uuid4())]
+    signing_key, require_signed = app_simple.TICKET_SIGNING_KEY, app_simple.REQUIRE_SIGNED_TICKETS
+    # Read when the event is first loaded, by the upload
+    app_simple.TICKET_SIGNING_KEY, app_simple.REQUIRE_SIGNED_TICKETS = 'secret', True
+    try:
+        app_simple, client = app_client_with_tickets('test-signed', ticket_ids)
+        signed = TicketSigner('secret', 'test-signed').sign(ticket_ids[0], 'VIP')
+        forged = signed.replace('VIP', 'Crew')
+        other_key = TicketSigner('guess', 'test-signed').sign(ticket_ids[0], 'VIP')
+        
+        for code, message in [(ticket_ids[0], 'Unsigned ticket code'), (forged, 'Invalid ticket signature'),
+                              (other_key, 'Invalid ticket signature')]:
+            result = client.post('/verify', json={'ticket_id': code}).json
+            assert not result['valid'] and result['message'] == message, result
+        batch = client.post('/verify_batch', json={'scans': [{'ticket_id': ticket_ids[0]}]}).json
+        assert batch['results'][0]['message'] == 'Unsigned ticket code'
+        assert client.get('/get_stats').json['stats']['rejected'] == 4
+        print("✅ Unsigned and forged codes rejected and counted")
+        
+        result = client.post('/verify', json={'ticket_id': signed}).json
+        assert result['valid'] and result['data']['ticket_id'] == ticket_ids[0]
+        print("✅ Signed code admitted")
+    finally:
+        app_simple.TICKET_SIGNING_KEY, app_simple.REQUIRE_SIGNED_TICKETS = signing_key, require_signed
+        remove_app_event(app_simple, 'test-signed')
+    return True
+
+def test_ticket_bloom_filter():
+    """Test the ticket snapshot filter used for offline lookups"""
+    print("Testing ticket Bloom filter...")
+    from bloom import BloomFilter
+    
+    ticket_ids = [str(uuid.uuid4()) for _ in range(2000)]
+    bloom = BloomFilter.for_capacity(len(ticket_ids), 0.01)
+    for ticket_id in ticket_ids:
+        bloom.add(ticket_id)
+    
+    assert all(ticket_id in bloom for ticket_id in ticket_ids)
+    false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(2000))
+    assert false_positives < 100
+    print(f"✅ All tickets found, {false_positives} false positives in 2000 lookups")
+    
+    encoded = bloom.to_dict()
+    assert len(base64.b64decode(encoded['data'])) == (encoded['bits'] + 7) // 8
+    print("✅ Filter serialized for scanners")
+    return True
+
+def test_ticket_signing():
+    """Test signed QR payloads"""
+    print("Testing ticket signing...")
+    from ticket_signing import TicketSigner, InvalidTicketCode, is_signed
+    
+    signer = TicketSigner('secret', 'conf-2026')
+    ticket_id = str(uuid.uuid4())
+    payload = signer.sign(ticket_id, 'VIP')
+    assert is_signed(payload) and not is_signed(ticket_id) and not is_signed(42)
+    assert signer.verify(payload) == (ticket_id, 'VIP')
+    print("✅ Signed payload verified")
+    
+    forged = payload.replace('VIP', 'Crew')
+    other_event = TicketSigner('secret', 'other').sign(ticket_id, 'VIP')
+    other_key = TicketSigner('guess', 'conf-2026').sign(ticket_id, 'VIP')
+    for code, message in [(forged, 'Invalid ticket signature'), (other_key, 'Invalid ticket signature'),
+                          (other_event, 'Ticket is for another event'), ('TK1:junk', 'Malformed ticket code')]:
+        try:
+            signer.verify(code)
+            assert False, code
+        except InvalidTicketCode as e:
+            assert str(e) == message
+    print("✅ Forged, other-event and malformed codes rejected")
+    return True
+
+def test_broadcast_coalescing():
+    """Test that dashboard updates are coalesced per flush"""
+    print("Testing coalesced broadcasts...")
+    from broadcast import BroadcastAggregator
+    
+    class RecordingSocket:
+        def __init__(self):
+            self.events = []
+        
+        def emit(self, event, data, to=None):
+            self.events.append((event, data, to))
+    
+    socket = RecordingSocket()
+    broadcaster = BroadcastAggregator(socket, lambda: {'valid': 3}, max_batch=2, room='event:a')
+    broadcaster.start = lambda: None
+    
+    for i in range(3):
+        broadcaster.add_scan({'ticket_id': str(i)})
+    broadcaster.stats_changed()
+    assert broadcaster.flush() == 2
+    assert socket.events == [
+        ('stats_update', {'valid': 3}, 'event:a'),
+        ('new_scan', [{'ticket_id': '1'}, {'ticket_id': '2'}], 'event:a')
+    ]
+    print("✅ Scans batched into one event with one stats update")
+    
+    assert broadcaster.flush() == 0
+    print("✅ Nothing emitted without new updates")
+    return True
+
+def test_recent_scans_feed():
+    """Test the recent scans ring buffer and cursor reads"""
+    print("Testing recent scans feed...")
+    from scan_feed import RecentScans
+    
+    feed = RecentScans(5)
+    for i in range(8):
+        feed.add({'ticket_id': str(i), 'gate': 'North' if i % 2 else 'South'})
+    
+    scans, cursor = feed.since(0)
+    assert len(feed) == 5 and cursor == 8
+    assert [scan['ticket_id'] for scan in scans] == ['3', '4', '5', '6', '7']
+    print("✅ Only the newest scans kept")
+    
+    feed.add({'ticket_id': '8', 'gate': 'South'})
+    scans, cursor = feed.since(8)
+    assert [scan['id'] for scan in scans] == [9] and cursor == 9
+    assert feed.since(9) == ([], 9)
+    print("✅ Cursor reads return only new scans")
+    
+    scans, cursor = feed.since(0, gate='North', limit=1)
+    assert [scan['ticket_id'] for scan in scans] == ['5'] and cursor == 6
+    scans, cursor = feed.since(cursor, gate='North', limit=1)
+    assert [scan['ticket_id'] for scan in scans] == ['7'] and cursor == 8
+    print("✅ Scans filtered by gate")
+    
+    # Pages continue from the last scan returned, so none are skipped
+    seen = []
+    cursor = 0
+    while cursor < feed.last_id:
+        scans, cursor = feed.since(cursor, limit=2)
+        seen += [scan['id'] for scan in scans]
+    assert seen == [5, 6, 7, 8, 9]
+    assert RecentScans(5).source != feed.source and scans[0]['source'] == feed.source
+    print("✅ Feed paged oldest first with a per-feed source")
+    return True
+
+def test_metrics_rendering():
+    """Test Prometheus counters and histograms"""
+    print("Testing metrics...")
+    from metrics import Counter, Histogram, REGISTRY, render
+    
+    scans = Counter('test_scans', 'Scans', ['result'])
+    latency = Histogram('test_latency_seconds', 'Latency', ['endpoint'], buckets=(0.01, 0.1))
+    try:
+        scans.inc('valid')
+        scans.inc('valid')
+        scans.inc('invalid')
+        latency.observe(0.005, '/verify')
+        latency.observe(0.05, '/verify')
+        latency.observe(5, '/verify')
+        with latency.time('/get_stats'):
+            pass
+        
+        text = render()
+        assert '# TYPE test_scans counter' in text
+        assert 'test_scans_total{result="valid"} 2.0' in text
+        assert 'test_latency_seconds_bucket{endpoint="/verify",le="0.01"} 1' in text
+        assert 'test_latency_seconds_bucket{endpoint="/verify",le="0.1"} 2' in text
+        assert 'test_latency_seconds_bucket{endpoint="/verify",le="+Inf"} 3' in text
+        assert 'test_latency_seconds_count{endpoint="/verify"} 3' in text
+        assert latency.count('/get_stats') == 1
+        print("✅ Metrics rendered in Prometheus format")
+        
+        scans.discard(result='invalid')
+        assert scans.value('invalid') == 0 and scans.value('valid') == 2
+        print("✅ Series discarded by label")
+    finally:
+        REGISTRY.remove(scans)
+        REGISTRY.remove(latency)
+    return True
+
+def test_event_registry():
+    """Test lazy loading and idle eviction of events"""
+    print("Testing event registry...")
+    from events import Event, EventRegistry, valid_event_id
+    
+    opened = []
+    
+    def create(event_id):
+        opened.append(event_id)
+        return Event(event_id, os.path.join('uploads', 'events', event_id), lambda path: None)
+    
+    registry = EventRegistry(create, idle_seconds=3600, max_loaded=2)
+    with registry.using('a') as event:
+        assert registry.acquire('a') is event
+        registry.release(event)
+    assert opened == ['a'] and registry.loaded() == ['a']
+    print("✅ Events loaded once, on first use")
+    
+    busy = registry.acquire('b')
+    registry.release(registry.acquire('c'))
+    assert registry.loaded() == ['b', 'c']
+    registry.release(busy)
+    print("✅ Least recently used idle event unloaded past the limit")
+    
+    registry.idle_seconds = 0
+    registry._last_sweep = 0
+    with registry.using('d'):
+        assert registry.loaded() == ['d']
+    print("✅ Idle events unloaded")
+    
+    # An event evicted by one request is reloaded by another only once its
+    # pending check-ins are compacted
+    import threading
+    import time
+    order = []
+    
+    class SlowClosingEvent(Event):
+        def close(self):
+            time.sleep(0.2)
+            order.append(('closed', self.event_id))
+    
+    def create_slow(event_id):
+        order.append(('loaded', event_id))
+        return SlowClosingEvent(event_id, os.path.join('uploads', 'events', event_id), lambda path: None)
+    
+    registry = EventRegistry(create_slow, idle_seconds=0, max_loaded=10)
+    registry.release(registry.acquire('e'))
+    registry._last_sweep = 0
+    evictor = threading.Thread(target=lambda: registry.release(registry.acquire('f')))
+    evictor.start()
+    time.sleep(0.05)
+    registry.release(registry.acquire('e'))
+    evictor.join()
+    assert order[:4] == [('loaded', 'e'), ('loaded', 'f'), ('closed', 'e'), ('loaded', 'e')], order
+    print("✅ Evicted events reloaded only after closing")
+    
+    assert valid_event_id('conf-2026_day1')
+    assert not valid_event_id('../uploads') and not valid_event_id('a:b') and not valid_event_id('')
+    print("✅ Event IDs validated")
+    return True
+
+def test_gate_stats():
+    """Test rolling per-gate throughput counters"""
+    print("Testing gate stats...")
+    from gate_stats import GateStats, OTHER, UNASSIGNED
+    
+    gates = GateStats(window=60, bucket=10)
+    gates.register('sid-1', 'North')
+    gates.register('sid-2', 'North')
+    gates.register('sid-3', 'South')
+    for second in range(30):
+        gates.record('North', second % 3 != 0, queue_seconds=1.0, now=1000 + second)
+    gates.record('South', True, now=1020)
+    gates.record(None, False, now=1020)
+    
+    north, south, unassigned = gates.snapshot(now=1030)
+    assert north['gate'] == 'North' and north['scans'] == 30 and north['scanners'] == 2
+    assert north['scans_per_minute'] == 60.0 and north['scans_per_minute_per_scanner'] == 30.0
+    assert north['valid_ratio'] == 0.667 and north['avg_queue_seconds'] == 1.0
+    assert south['scans'] == 1 and south['avg_queue_seconds'] is None
+    assert unassigned['gate'] == UNASSIGNED and unassigned['scanners'] == 0
+    print("✅ Scans per minute, valid ratio and queue time per gate")
+    
+    north = gates.snapshot(now=1075)[0]
+    assert north['scans'] == 10 and north['scans_per_minute'] == 10.0
+    print("✅ Old buckets leave the rolling window")
+    
+    gates.unregister('sid-3')
+    gates.register('sid-2', 'South')
+    assert gates.scanner_count() == 2
+    assert [gate['scanners'] for gate in gates.snapshot(now=1075)] == [1, 1, 0]
+    print("✅ Scanners counted at their registered gate")
+    
+    assert gates.known_gate('North') == 'North' and gates.known_gate(None) is None
+    assert gates.known_gate('Gate 12345') == OTHER
+    print("✅ Unregistered gate names counted as other")
+    return True
+
+def test_load_test_scan_mix():
+    """Test the load generator's scan mix"""
+    print("Testing load test scan mix...")
+    from loadtest import ScanMix
+    
+    ticket_ids = [f'ticket-{i}' for i in range(50)]
+    mix = ScanMix(ticket_ids, duplicate=0.2, invalid=0.1, seed=1)
+    scans = [mix.next() for _ in range(200)]
+    
+    first_scans = [scan for scan in scans if scan in ticket_ids]
+    assert set(first_scans) == set(ticket_ids)
+    assert sum(scan not in ticket_ids for scan in scans) >= 10
+    assert len(first_scans) > len(set(first_scans))
+    print("✅ Scan mix covers every ticket with duplicates and invalid IDs")
+    return True
+
+def test_benchmark_harness():
+    """Test that the benchmark harness drives every endpoint"""
+    print("Testing benchmark harness...")
+    from benchmark import percentile, run_benchmark
+    
+    assert percentile([5, 1, 4, 2, 3], 50) == 3
+    assert percentile(list(range(1, 101)), 99) == 99
+    
+    results = run_benchmark(tickets=20, requests=20, concurrency=2, uploads=1, generates=1)
+    assert [result['endpoint'] for result in results] == [
+        'upload', 'generate_tickets', 'verify', 'verify x2', 'verify socket', 'get_stats', 'get_stats x2'
+    ]
+    assert all(result['errors'] == 0 and result['requests'] for result in results)
+    print("✅ Benchmarks ran without errors")
+    return True
+
 def test_dependencies():
     """Test if all required dependencies are available"""
     print("Testing dependencies...")
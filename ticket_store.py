@@ -0,0 +1,1249 @@
+"""Ticket stores for the ticket manager.
+
+Two backends implement the TicketStore interface and are picked at startup
+with open_store():
+
+- ``csv``: the uploaded participant file is read once and kept in memory
+  together with a UUID -> row index, so verifying a ticket is a dict lookup
+  instead of a scan over the whole file. Check-ins are appended to a scan
+  journal next to the CSV and folded back into it by periodic compaction.
+- ``sqlite``: the upload is imported into an SQLite database in WAL mode
+  with a unique index on ``uuid``; a check-in is a single-row UPDATE.
+  Counters and the check-in log live in the database too, so several
+  server processes can share one store.
+
+CSV stays the canonical import and export format for both: uploads (CSV
+or XLSX) are streamed into the ticket CSV by import_ticket_file(), and
+either replace the tickets or are merged into the loaded store with
+TicketStore.merge_file().
+"""
+import csv
+import datetime
+import functools
+import itertools
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from metrics import Histogram
+from server_mode import native_lock, start_native_thread
+
+logger = logging.getLogger(__name__)
+
+FILE_IO_SECONDS = Histogram('ticket_file_io_seconds', 'Time spent reading and writing ticket files', ['operation'])
+
+DEFAULT_FIELDNAMES = ['name', 'email', 'uuid', 'scanned', 'scan_time']
+REQUIRED_COLUMNS = ['name', 'email']
+
+# Rows written per transaction when importing into SQLite
+IMPORT_CHUNK_SIZE = 5000
+
+# Rows merged per lock hold (CSV) or transaction (SQLite); check-ins are
+# served between chunks
+MERGE_CHUNK_SIZE = 1000
+
+# Idle SQLite connections kept open per store; connections opened beyond
+# this under load are closed once their call returns
+SQLITE_POOL_SIZE = 8
+
+# Number of journalled check-ins before the journal is rotated and
+# compacted into the CSV in the background
+COMPACT_EVERY = 500
+
+# Number of locks check-ins are striped over; scans of different tickets
+# rarely share a lock and so proceed in parallel
+LOCK_STRIPES = 64
+
+# Columns the CSV store keeps outside the packed per-ticket records
+TICKET_COLUMNS = ('uuid', 'scanned', 'scan_time')
+
+# Joins a ticket's other column values into one packed record
+FIELD_SEPARATOR = '\x1f'
+
+
+def _cell_to_str(value):
+    """Render an XLSX cell value the way it would appear in the ticket CSV"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'True' if value else 'False'
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _iter_csv_file(path):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        reader = csv.DictReader(file)
+        reader.fieldnames = [name.strip() for name in reader.fieldnames or []]
+        yield reader.fieldnames
+        yield from reader
+
+
+def _iter_xlsx_file(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('Reading .xlsx files requires openpyxl (pip install openpyxl)')
+
+    # Read-only mode streams rows from the sheet XML instead of loading it
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        records = workbook.active.iter_rows(values_only=True)
+        header = next(records, None) or ()
+        columns = [str(name).strip() if name is not None else '' for name in header]
+        yield [name for name in columns if name]
+        for record in records:
+            if all(value is None for value in record):
+                continue
+            yield {name: _cell_to_str(value) for name, value in zip(columns, record) if name}
+    finally:
+        workbook.close()
+
+
+def read_ticket_rows(path):
+    """Return (fieldnames, row iterator) for a .csv or .xlsx ticket file
+
+    Rows are produced lazily, so files of any size are read in bounded
+    memory. Close the iterator if it is abandoned early.
+    """
+    if path.lower().endswith('.xlsx'):
+        rows = _iter_xlsx_file(path)
+    else:
+        rows = _iter_csv_file(path)
+    fieldnames = next(rows)
+    return fieldnames, rows
+
+
+def import_ticket_file(source_path, csv_path):
+    """Stream an uploaded ticket file into a ticket CSV
+
+    Checks the required columns before reading any rows and drops rows that
+    repeat an earlier row's UUID. Returns ``(imported, duplicates)``; raises
+    ValueError with a user-facing message for unusable files.
+    """
+    fieldnames, rows = read_ticket_rows(source_path)
+    missing_columns = [name for name in REQUIRED_COLUMNS if name not in fieldnames]
+    if missing_columns:
+        rows.close()
+        raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+
+    seen = set()
+    imported = duplicates = 0
+    try:
+        with FILE_IO_SECONDS.time('import'), open(csv_path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                ticket_id = row.get('uuid')
+                if ticket_id:
+                    if ticket_id in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(ticket_id)
+                writer.writerow(row)
+                imported += 1
+    finally:
+        rows.close()
+
+    if not imported:
+        os.remove(csv_path)
+        raise ValueError('Invalid file format or empty file')
+    if duplicates:
+        logger.warning(f"Dropped {duplicates} rows with duplicate UUIDs from {source_path}")
+    return imported, duplicates
+
+
+def journal_path_for(path):
+    """Return the scan journal path that belongs to a ticket file"""
+    return os.path.splitext(path)[0] + '.journal'
+
+
+def db_path_for(path):
+    """Return the SQLite database path that belongs to a ticket file"""
+    return os.path.splitext(path)[0] + '.db'
+
+
+class ScanJournal:
+    """Append-only log of check-ins, one JSON line per scan event
+
+    rotate() moves the log aside for a background compaction while new
+    check-ins go to a fresh file; replay() reads the rotated log first.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.rotated_path = path + '.rotated'
+        self.fsync = fsync
+        self._file = None
+
+    def append(self, ticket_id, scan_time):
+        self.append_many([(ticket_id, scan_time)])
+
+    def append_many(self, events):
+        """Append (ticket_id, scan_time) events with a single flush and fsync"""
+        with FILE_IO_SECONDS.time('journal_append'):
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(''.join(
+                json.dumps({'uuid': ticket_id, 'scan_time': scan_time}) + '\n'
+                for ticket_id, scan_time in events
+            ))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def replay(self):
+        """Yield (ticket_id, scan_time) for every complete journal line"""
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        logger.warning(f"Skipping unreadable journal line in {path}")
+                        continue
+                    yield event['uuid'], event['scan_time']
+
+    def rotate(self):
+        """Move the journal aside and start an empty one
+
+        Returns False, keeping the current journal, while a rotated journal
+        is still waiting to be compacted.
+        """
+        if os.path.exists(self.rotated_path):
+            return False
+        self.close()
+        if os.path.exists(self.path):
+            os.replace(self.path, self.rotated_path)
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        return True
+
+    def discard_rotated(self):
+        """Drop the rotated journal once its check-ins are in the CSV"""
+        try:
+            os.remove(self.rotated_path)
+        except FileNotFoundError:
+            pass
+
+    def truncate(self):
+        """Empty the journal, including a rotated one"""
+        self.close()
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        self.discard_rotated()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ScanCounters:
+    """Ticket counts and check-in sequence kept up to date on every check-in
+
+    Counts are seeded once when a store is loaded and then incremented per
+    admitted ticket, with one bucket per scan day, so reading them never
+    touches the ticket data. The IDs of checked-in tickets are kept in
+    admission order so scanners can fetch only what changed since their
+    last sync.
+    """
+
+    def __init__(self):
+        self._lock = native_lock()
+        self.reset(0, [])
+
+    def reset(self, total, scanned):
+        """Seed the counts from the ticket total and (ticket_id, scan_time) check-ins"""
+        by_day = Counter(scan_time[:10] for _, scan_time in scanned if scan_time)
+        with self._lock:
+            self.total = total
+            self.checked_in = len(scanned)
+            self.invalid = 0
+            self.rejected = 0
+            self.by_day = by_day
+            self.scanned_ids = [ticket_id for ticket_id, _ in scanned]
+
+    def add_tickets(self, count):
+        with self._lock:
+            self.total += count
+
+    def record(self, ticket_id, scan_time):
+        with self._lock:
+            self.checked_in += 1
+            self.by_day[scan_time[:10]] += 1
+            self.scanned_ids.append(ticket_id)
+
+    def record_invalid(self):
+        """Count a scan of an unknown ticket"""
+        with self._lock:
+            self.invalid += 1
+
+    def record_rejected(self):
+        """Count a forged or malformed code, refused without a ticket lookup"""
+        with self._lock:
+            self.rejected += 1
+
+    def scanned_since(self, cursor):
+        """Return IDs checked in after ``cursor`` and the cursor to use next"""
+        with self._lock:
+            return self.scanned_ids[cursor:], len(self.scanned_ids)
+
+    def snapshot(self):
+        today = datetime.date.today().isoformat()
+        with self._lock:
+            return {
+                'total_tickets': self.total,
+                'valid': self.checked_in,
+                'invalid': self.invalid + self.rejected,
+                'rejected': self.rejected,
+                'scanned_today': self.by_day.get(today, 0)
+            }
+
+
+def _pooled(method):
+    """Run a SqliteTicketStore or SqliteScanCounters method with a connection checked out"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with getattr(self, 'store', self)._connection():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SqliteScanCounters:
+    """ScanCounters kept in the ticket database
+
+    Counts and the check-in log are tables next to the tickets, updated in
+    the same transaction as the check-in itself, so every process sharing
+    the database reads the same numbers. The check-in log's ``seq`` is the
+    scanned_since() cursor.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @_pooled
+    def reset(self, total, scanned):
+        """Seed the counts from the ticket total and (ticket_id, scan_time) check-ins"""
+        by_day = Counter(scan_time[:10] for _, scan_time in scanned if scan_time)
+        conn = self.store._conn()
+        with conn:
+            conn.execute('DELETE FROM counters')
+            conn.execute('DELETE FROM scan_log')
+            conn.executemany('INSERT INTO counters (name, value) VALUES (?, ?)', [
+                ('total', total), ('checked_in', len(scanned)), ('invalid', 0), ('rejected', 0)
+            ] + [(f'day:{day}', count) for day, count in by_day.items()])
+            conn.executemany('INSERT INTO scan_log (uuid, scan_time) VALUES (?, ?)', scanned)
+
+    @_pooled
+    def add_tickets(self, count):
+        """Count added tickets; runs inside the caller's transaction"""
+        self.store._conn().execute("UPDATE counters SET value = value + ? WHERE name = 'total'", (count,))
+
+    @_pooled
+    def record(self, ticket_id, scan_time):
+        """Count a check-in; runs inside the caller's check-in transaction"""
+        conn = self.store._conn()
+        conn.execute('INSERT INTO scan_log (uuid, scan_time) VALUES (?, ?)', (ticket_id, scan_time))
+        conn.execute("UPDATE counters SET value = value + 1 WHERE name = 'checked_in'")
+        self._increment(conn, f'day:{scan_time[:10]}')
+
+    @_pooled
+    def record_invalid(self):
+        """Count a scan of an unknown ticket"""
+        conn = self.store._conn()
+        with conn:
+            self._increment(conn, 'invalid')
+
+    @_pooled
+    def record_rejected(self):
+        """Count a forged or malformed code, refused without a ticket lookup"""
+        conn = self.store._conn()
+        with conn:
+            self._increment(conn, 'rejected')
+
+    @staticmethod
+    def _increment(conn, name):
+        conn.execute(
+            'INSERT INTO counters (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1',
+            (name,)
+        )
+
+    @_pooled
+    def scanned_since(self, cursor):
+        """Return IDs checked in after ``cursor`` and the cursor to use next"""
+        records = self.store._conn().execute(
+            'SELECT seq, uuid FROM scan_log WHERE seq > ? ORDER BY seq', (cursor,)
+        ).fetchall()
+        return [ticket_id for _, ticket_id in records], records[-1][0] if records else cursor
+
+    @_pooled
+    def snapshot(self):
+        today = f'day:{datetime.date.today().isoformat()}'
+        counts = dict(self.store._conn().execute(
+            "SELECT name, value FROM counters WHERE name IN ('total', 'checked_in', 'invalid', 'rejected', ?)",
+            (today,)
+        ))
+        return {
+            'total_tickets': counts.get('total', 0),
+            'valid': counts.get('checked_in', 0),
+            'invalid': counts.get('invalid', 0) + counts.get('rejected', 0),
+            'rejected': counts.get('rejected', 0),
+            'scanned_today': counts.get(today, 0)
+        }
+
+
+class TicketStore:
+    """Interface shared by the ticket store backends
+
+    Rows are dicts of column name -> string, as read from the participant
+    CSV, with ``scanned`` stored as ``'True'``/``'False'``. ``rows`` holds
+    every row in upload order, ``fieldnames`` the CSV columns and
+    ``counters`` the ScanCounters (or SqliteScanCounters) for the loaded
+    tickets. ``ticket_set_id`` changes whenever the set of ticket UUIDs does.
+    """
+
+    fieldnames = DEFAULT_FIELDNAMES
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def get(self, ticket_id):
+        """Return the row for a ticket UUID, or None if it is unknown"""
+        raise NotImplementedError
+
+    def check_in(self, ticket_id, scan_time):
+        """Atomically admit a ticket at most once, returning (row, admitted)"""
+        return self.check_in_many([(ticket_id, scan_time)])[0]
+
+    def check_in_many(self, scans):
+        """Check in (ticket_id, scan_time) pairs in order as one batch
+
+        Returns a (row, admitted) pair per scan, as check_in() does. A ticket
+        repeated within the batch is admitted by its first scan only.
+        """
+        raise NotImplementedError
+
+    def page(self, cursor=0, limit=50):
+        """Return up to ``limit`` rows after ``cursor`` and the next cursor
+
+        Cursors are opaque integers; the next cursor is None on the last page.
+        A negative cursor reads from the start.
+        """
+        raise NotImplementedError
+
+    def iter_rows(self, batch_size=1000):
+        """Iterate over all rows a page at a time"""
+        cursor = 0
+        while cursor is not None:
+            rows, cursor = self.page(cursor, batch_size)
+            yield from rows
+
+    def assign_ticket_ids(self):
+        """Give every row a UUID and scan columns and persist them"""
+        raise NotImplementedError
+
+    def merge_rows(self, fieldnames, rows):
+        """Insert new tickets and update changed ones in place, and persist them
+
+        Rows are matched to tickets by UUID, or by email when they have no
+        UUID. Matched tickets keep their UUID and scan state; tickets missing
+        from ``rows`` are kept. Returns ``(inserted, updated, unchanged)``.
+        """
+        raise NotImplementedError
+
+    def merge_file(self, path):
+        """Merge a ticket CSV written by import_ticket_file() into the store"""
+        fieldnames, rows = read_ticket_rows(path)
+        try:
+            return self.merge_rows(fieldnames, rows)
+        finally:
+            rows.close()
+
+    def export_csv(self, path):
+        """Write the current ticket state to a CSV file"""
+        raise NotImplementedError
+
+    def compact(self):
+        return True
+
+    def close(self):
+        pass
+
+
+def ensure_ticket_fields(row):
+    """Fill in the UUID and scan columns of a row; True if it changed"""
+    changed = False
+    if 'uuid' not in row or not row['uuid']:
+        row['uuid'] = str(uuid.uuid4())
+        changed = True
+    if 'scanned' not in row:
+        row['scanned'] = 'False'
+        changed = True
+    if 'scan_time' not in row:
+        row['scan_time'] = ''
+        changed = True
+    return changed
+
+
+def _email_key(email):
+    return (email or '').strip().lower()
+
+
+def _chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class EmailMatcher:
+    """Finds the existing ticket for an uploaded row without a UUID
+
+    ``load`` returns (position, email) for every existing ticket; it is
+    only called once a row needs matching by email. The n-th row with an
+    email matches the n-th ticket with it, so tickets sharing an email
+    (e.g. booked for a family) are matched one to one. Tickets already
+    matched by UUID are skipped.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._positions = None
+        self.matched = set()
+
+    def match(self, email):
+        if self._positions is None:
+            self._positions = {}
+            for position, existing in self._load():
+                if _email_key(existing):
+                    self._positions.setdefault(_email_key(existing), deque()).append(position)
+        positions = self._positions.get(_email_key(email))
+        while positions:
+            position = positions.popleft()
+            if position not in self.matched:
+                self.matched.add(position)
+                return position
+        return None
+
+
+def _ticket_key(ticket_id):
+    """Compact index key for a ticket ID
+
+    IDs in canonical UUID form are kept as their 16 raw bytes; any other
+    ID (e.g. custom IDs in an uploaded file) is kept as given, so every ID
+    converts back to exactly the string it was read from.
+    """
+    if isinstance(ticket_id, str) and len(ticket_id) == 36 and ticket_id[8:24:5] == '----':
+        digits = ticket_id.replace('-', '')
+        try:
+            key = bytes.fromhex(digits)
+        except ValueError:
+            return ticket_id
+        if len(key) == 16 and key.hex() == digits:
+            return key
+    return ticket_id
+
+
+def _ticket_id(key):
+    if isinstance(key, bytes):
+        digits = key.hex()
+        return f'{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}'
+    return key
+
+
+def _pack(values):
+    joined = FIELD_SEPARATOR.join(values)
+    if joined.count(FIELD_SEPARATOR) != max(len(values) - 1, 0):
+        # A value contains the separator itself; keep it unpacked
+        return tuple(values)
+    return joined.encode('utf-8')
+
+
+def _unpack(record, count):
+    if isinstance(record, tuple):
+        return list(record)
+    return record.decode('utf-8').split(FIELD_SEPARATOR) if count else []
+
+
+class CsvTicketStore(TicketStore):
+    """Tickets held in compact in-memory columns, backed by a CSV file and a scan journal
+
+    Each ticket is its ID key (16 bytes for UUIDs), one packed record of
+    its other columns and a bit in the scanned bitmap; scan times are kept
+    for scanned tickets only. Row dicts are built only when a ticket is
+    read, e.g. for a scan response, so large events stay small in memory.
+
+    Pass ``fresh=True`` when the CSV has just been replaced by an upload so
+    that a journal left over from the previous file is discarded instead of
+    replayed.
+    """
+
+    def __init__(self, path=None, fresh=False, fsync=True):
+        self.path = path
+        self.fieldnames = list(DEFAULT_FIELDNAMES)
+        self.journal = None
+        self.fsync = fsync
+        self.pending = 0
+        self.counters = ScanCounters()
+        self._locks = [native_lock() for _ in range(LOCK_STRIPES)]
+        self._write_lock = native_lock(reentrant=True)
+        # Serialises CSV rewrites; held by background compaction instead of
+        # the write lock, so check-ins keep journalling meanwhile
+        self._compact_lock = native_lock()
+        self._compacting = False
+        # Keeps a merge's chunks from interleaving with other ticket updates
+        self._merge_lock = native_lock()
+        self._clear()
+        if path:
+            if fresh:
+                ScanJournal(journal_path_for(path)).truncate()
+            self.load(path)
+
+    def _clear(self):
+        self._set_columns()
+        self._keys = []
+        self._records = []
+        self._scanned = bytearray()
+        self._scan_times = {}
+        self.index = {}
+
+    def _set_columns(self):
+        # Check-ins need somewhere to go once tickets have IDs
+        if 'uuid' in self.fieldnames:
+            self.fieldnames += [name for name in TICKET_COLUMNS if name not in self.fieldnames]
+        self._data_fields = [name for name in self.fieldnames if name not in TICKET_COLUMNS]
+        self._data_columns = [self.fieldnames.index(name) for name in self._data_fields]
+        self._ticket_columns = {
+            name: self.fieldnames.index(name) for name in TICKET_COLUMNS if name in self.fieldnames
+        }
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _append(self, values):
+        if len(values) < len(self.fieldnames):
+            values = values + [''] * (len(self.fieldnames) - len(values))
+        position = len(self._keys)
+        columns = self._ticket_columns
+
+        ticket_id = values[columns['uuid']] if 'uuid' in columns else ''
+        self._keys.append(_ticket_key(ticket_id) if ticket_id else None)
+        self._records.append(_pack([values[column] for column in self._data_columns]))
+        if position % 8 == 0:
+            self._scanned.append(0)
+        if 'scanned' in columns and values[columns['scanned']] == 'True':
+            self._scanned[position >> 3] |= 1 << (position & 7)
+        if 'scan_time' in columns and values[columns['scan_time']]:
+            self._scan_times[position] = values[columns['scan_time']]
+
+    def _is_scanned(self, position):
+        return bool(self._scanned[position >> 3] & (1 << (position & 7)))
+
+    def _row(self, position):
+        """Build the row dict for one ticket"""
+        row = dict(zip(self._data_fields, _unpack(self._records[position], len(self._data_fields))))
+        if 'uuid' in self._ticket_columns:
+            key = self._keys[position]
+            row['uuid'] = _ticket_id(key) if key is not None else ''
+        if 'scanned' in self._ticket_columns:
+            row['scanned'] = 'True' if self._is_scanned(position) else 'False'
+        if 'scan_time' in self._ticket_columns:
+            row['scan_time'] = self._scan_times.get(position, '')
+        return row
+
+    @property
+    def rows(self):
+        return [self._row(position) for position in range(len(self))]
+
+    def load(self, path=None):
+        """Load tickets from the CSV file, replay the journal and build the UUID index"""
+        if path:
+            self.path = path
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = ScanJournal(journal_path_for(self.path), fsync=self.fsync) if self.path else None
+        self.pending = 0
+        self._clear()
+        if not self.path or not os.path.exists(self.path):
+            self.counters.reset(0, [])
+            self.ticket_set_id = uuid.uuid4().hex
+            return
+
+        try:
+            with FILE_IO_SECONDS.time('csv_read'), open(self.path, 'r', encoding='utf-8', newline='') as file:
+                reader = csv.reader(file)
+                header = next(reader, None)
+                if header:
+                    self.fieldnames = header
+                self._set_columns()
+                for values in reader:
+                    if values:
+                        self._append(values)
+        except Exception as e:
+            logger.error(f"Error reading CSV: {e}")
+            self._clear()
+        self.rebuild_index()
+
+        for ticket_id, scan_time in self.journal.replay():
+            position = self.index.get(_ticket_key(ticket_id))
+            if position is not None:
+                self._scanned[position >> 3] |= 1 << (position & 7)
+                self._scan_times[position] = scan_time
+                self.pending += 1
+        if self.pending:
+            logger.info(f"Replayed {self.pending} check-ins from {self.journal.path}")
+        self.counters.reset(len(self), [
+            (_ticket_id(key), self._scan_times.get(position, ''))
+            for position, key in enumerate(self._keys)
+            if key is not None and self._is_scanned(position)
+        ])
+        self.ticket_set_id = uuid.uuid4().hex
+
+    def rebuild_index(self):
+        """Rebuild the ticket key -> position index"""
+        self.index = {key: position for position, key in enumerate(self._keys) if key is not None}
+
+    def get(self, ticket_id):
+        """Return the row for a ticket UUID, or None if it is unknown"""
+        position = self.index.get(_ticket_key(ticket_id))
+        return self._row(position) if position is not None else None
+
+    def page(self, cursor=0, limit=50):
+        cursor = max(cursor, 0)
+        end = min(cursor + limit, len(self))
+        rows = [self._row(position) for position in range(cursor, end)]
+        return rows, end if end < len(self) else None
+
+    def _lock_for(self, position):
+        # Tickets sharing a bitmap byte share a stripe
+        return self._locks[(position >> 3) % LOCK_STRIPES]
+
+    def check_in_many(self, scans):
+        """Atomically admit each ticket at most once
+
+        ``admitted`` is True only for the one scan that flipped a ticket from
+        unscanned to scanned. The test-and-set runs under the ticket's lock
+        stripe; only the journal append is serialised across tickets, and a
+        batch is journalled with a single fsync. Once COMPACT_EVERY
+        check-ins have accumulated the journal is rotated and the CSV is
+        rewritten on a background thread.
+        """
+        results = []
+        events = []
+        for ticket_id, scan_time in scans:
+            position = self.index.get(_ticket_key(ticket_id))
+            if position is None:
+                results.append((None, False))
+                continue
+
+            with self._lock_for(position):
+                if self._is_scanned(position):
+                    results.append((self._row(position), False))
+                    continue
+                self._scanned[position >> 3] |= 1 << (position & 7)
+                self._scan_times[position] = scan_time
+            self.counters.record(ticket_id, scan_time)
+            events.append((ticket_id, scan_time))
+            results.append((self._row(position), True))
+
+        if events:
+            with self._write_lock:
+                self.journal.append_many(events)
+                self.pending += len(events)
+                if self.pending >= COMPACT_EVERY and not self._compacting:
+                    self._compacting = True
+                    if self.journal.rotate():
+                        self.pending = 0
+                    start_native_thread(self._compact_rotated)
+        return results
+
+    def _compact_rotated(self):
+        """Fold the rotated journal into the CSV, off the scan path"""
+        try:
+            with self._compact_lock:
+                if self.save():
+                    self.journal.discard_rotated()
+        finally:
+            with self._write_lock:
+                self._compacting = False
+
+    def merge_rows(self, fieldnames, rows):
+        """Merge rows in place; the UUID index is extended, not rebuilt
+
+        The write lock is taken per MERGE_CHUNK_SIZE rows, so check-ins are
+        journalled between chunks instead of waiting for the whole merge.
+        """
+        inserted = updated = unchanged = 0
+        with self._merge_lock:
+            with self._write_lock:
+                added = [name for name in fieldnames if name not in self.fieldnames]
+                if added:
+                    # New columns go last, so existing packed records stay valid
+                    # and read back with the new fields empty
+                    self.fieldnames = self.fieldnames + added
+                    self._set_columns()
+                email_column = self._data_fields.index('email') if 'email' in self._data_fields else None
+                # Only tickets from before the merge are matched by email
+                existing = len(self)
+            matcher = EmailMatcher(lambda: (
+                (position, _unpack(self._records[position], len(self._data_fields))[email_column])
+                for position in range(existing)
+            ) if email_column is not None else ())
+            new_ids = False
+
+            for chunk in _chunked(rows, MERGE_CHUNK_SIZE):
+                with self._write_lock:
+                    chunk_inserted = 0
+                    for row in chunk:
+                        ticket_id = row.get('uuid')
+                        if ticket_id:
+                            position = self.index.get(_ticket_key(ticket_id))
+                            if position is not None:
+                                matcher.matched.add(position)
+                        else:
+                            position = matcher.match(row.get('email'))
+
+                        if position is None:
+                            values = [row.get(name) or '' for name in self.fieldnames]
+                            position = len(self)
+                            with self._lock_for(position):
+                                self._append(values)
+                            if ticket_id:
+                                self.index[self._keys[position]] = position
+                                new_ids = True
+                                if self._is_scanned(position):
+                                    self.counters.record(ticket_id, self._scan_times.get(position, ''))
+                            chunk_inserted += 1
+                            continue
+
+                        current = _unpack(self._records[position], len(self._data_fields))
+                        current += [''] * (len(self._data_fields) - len(current))
+                        values = [row[name] if name in row else value for name, value in zip(self._data_fields, current)]
+                        if values != current:
+                            self._records[position] = _pack(values)
+                            updated += 1
+                        else:
+                            unchanged += 1
+                    self.counters.add_tickets(chunk_inserted)
+                    inserted += chunk_inserted
+
+            if new_ids:
+                self.ticket_set_id = uuid.uuid4().hex
+            if inserted or updated or added:
+                self.compact()
+        return inserted, updated, unchanged
+
+    def compact(self):
+        """Fold all journalled check-ins into the CSV now
+
+        Only the journal rotation holds the write lock; check-ins go to the
+        new journal while the CSV is rewritten.
+        """
+        with self._write_lock:
+            if self.journal is not None and self.journal.rotate():
+                self.pending = 0
+        with self._compact_lock:
+            if not self.save():
+                return False
+            # Every check-in in the rotated journal is in the saved rows
+            if self.journal is not None:
+                self.journal.discard_rotated()
+            return True
+
+    def assign_ticket_ids(self):
+        with self._merge_lock, self._write_lock:
+            changed = 'uuid' not in self.fieldnames
+            self.fieldnames += [name for name in TICKET_COLUMNS if name not in self.fieldnames]
+            self._set_columns()
+            for position, key in enumerate(self._keys):
+                if key is None:
+                    self._keys[position] = uuid.uuid4().bytes
+                    changed = True
+            self.rebuild_index()
+            self.compact()
+            if changed:
+                self.ticket_set_id = uuid.uuid4().hex
+
+    def export_csv(self, path):
+        self.compact()
+        with self._compact_lock, FILE_IO_SECONDS.time('export'):
+            shutil.copy2(self.path, path)
+
+    def close(self):
+        with self._write_lock:
+            if self.pending or self._compacting:
+                self.compact()
+            if self.journal is not None:
+                self.journal.close()
+
+    def save(self):
+        """Write all tickets back to the CSV file
+
+        The rows go to a temporary file that replaces the CSV in one step, so
+        a crash during compaction never leaves a half-written ticket file.
+        A background compaction can overlap a merge; columns and rows added
+        meanwhile are left to the merge's own compaction.
+        """
+        if not self.path:
+            return False
+
+        try:
+            tmp_path = self.path + '.tmp'
+            fieldnames = list(self.fieldnames)
+            with FILE_IO_SECONDS.time('csv_write'), open(tmp_path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction='ignore')
+                writer.writeheader()
+                writer.writerows(self._row(position) for position in range(len(self)))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            logger.error(f"Error writing CSV: {e}")
+            return False
+
+
+class SqliteTicketStore(TicketStore):
+    """Tickets kept in an SQLite database in WAL mode
+
+    Each row's columns are kept as JSON next to indexed ``uuid``,
+    ``scanned`` and ``scan_time`` columns, so a check-in touches one row
+    and readers are never blocked by the writer. Each call checks a
+    connection out of a small pool and returns it afterwards, so request
+    threads and greenlets do not each keep one open. All state, including
+    counters and the ticket set version, is in the database, so stores in
+    several processes can share it.
+    """
+
+    def __init__(self, db_path, csv_path=None, fresh=False):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._idle = []
+        self._pool_lock = native_lock()
+        self._merge_lock = native_lock()
+        # Hands the database's write lock over between this process's
+        # writers, instead of them polling for it in SQLite's busy handler
+        self._write_lock = native_lock()
+        self._closed = False
+        self.counters = SqliteScanCounters(self)
+        with self._connection():
+            self._create_schema(csv_path, fresh)
+
+    def _create_schema(self, csv_path, fresh):
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tickets (
+                seq INTEGER PRIMARY KEY,
+                uuid TEXT UNIQUE,
+                scanned INTEGER NOT NULL DEFAULT 0,
+                scan_time TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS scan_log (
+                seq INTEGER PRIMARY KEY,
+                uuid TEXT NOT NULL,
+                scan_time TEXT
+            );
+        """)
+        if csv_path and (fresh or not self._count_rows()):
+            self.import_csv(csv_path)
+        elif not conn.execute("SELECT 1 FROM counters WHERE name = 'total'").fetchone():
+            # Database written before counters were kept in it
+            self._reset_counters()
+
+    @_pooled
+    def _reset_counters(self):
+        conn = self._conn()
+        scanned = conn.execute('SELECT uuid, scan_time FROM tickets WHERE scanned = 1 ORDER BY scan_time').fetchall()
+        self.counters.reset(self._count_rows(), scanned)
+        with conn:
+            self._new_ticket_set(conn)
+
+    @contextmanager
+    def _connection(self):
+        """Check out a pooled connection for the calling thread
+
+        Nested calls, e.g. counters updated inside a check-in transaction,
+        share the outer call's connection.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        with self._pool_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            with self._pool_lock:
+                if not self._closed and len(self._idle) < SQLITE_POOL_SIZE:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def _conn(self):
+        """The connection checked out by the current call"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            raise RuntimeError('No SQLite connection checked out; decorate the method with @_pooled')
+        return conn
+
+    @_pooled
+    def import_csv(self, path):
+        """Replace all tickets with the rows of a CSV file
+
+        Rows are inserted IMPORT_CHUNK_SIZE at a time within one transaction,
+        so memory use does not grow with the file.
+        """
+        conn = self._conn()
+        imported = 0
+        try:
+            with FILE_IO_SECONDS.time('csv_read'), open(path, 'r', encoding='utf-8') as file, conn:
+                reader = csv.DictReader(file)
+                conn.execute('DELETE FROM tickets')
+                self._set_fieldnames(conn, list(reader.fieldnames or DEFAULT_FIELDNAMES))
+                chunk = []
+                for row in reader:
+                    chunk.append((row.get('uuid') or None, row.get('scanned') == 'True',
+                                  row.get('scan_time') or None, json.dumps(row)))
+                    if len(chunk) >= IMPORT_CHUNK_SIZE:
+                        imported += self._insert(conn, chunk)
+                        chunk = []
+                imported += self._insert(conn, chunk)
+        except Exception as e:
+            logger.error(f"Error reading CSV: {e}")
+        self._reset_counters()
+        logger.info(f"Imported {imported} tickets into {self.db_path}")
+
+    @staticmethod
+    def _insert(conn, records):
+        # Later duplicates of a UUID are dropped, as the CSV index does
+        conn.executemany(
+            'INSERT OR IGNORE INTO tickets (uuid, scanned, scan_time, data) VALUES (?, ?, ?, ?)',
+            records
+        )
+        return len(records)
+
+    @staticmethod
+    def _new_ticket_set(conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('ticket_set_id', ?)",
+            (uuid.uuid4().hex,)
+        )
+
+    @property
+    @_pooled
+    def ticket_set_id(self):
+        record = self._conn().execute("SELECT value FROM meta WHERE key = 'ticket_set_id'").fetchone()
+        return record[0] if record else ''
+
+    def _set_fieldnames(self, conn, fieldnames):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('fieldnames', ?)",
+            (json.dumps(fieldnames),)
+        )
+
+    @property
+    @_pooled
+    def fieldnames(self):
+        record = self._conn().execute("SELECT value FROM meta WHERE key = 'fieldnames'").fetchone()
+        return json.loads(record[0]) if record else list(DEFAULT_FIELDNAMES)
+
+    @staticmethod
+    def _to_row(record):
+        data, scanned, scan_time = record
+        row = json.loads(data)
+        if scanned:
+            row['scanned'] = 'True'
+            row['scan_time'] = scan_time or ''
+        return row
+
+    def _count_rows(self):
+        return self._conn().execute('SELECT COUNT(*) FROM tickets').fetchone()[0]
+
+    @_pooled
+    def __len__(self):
+        # Read from the maintained ticket total; COUNT(*) scans the whole
+        # table and len() is checked on every scan
+        record = self._conn().execute("SELECT value FROM counters WHERE name = 'total'").fetchone()
+        return record[0] if record else self._count_rows()
+
+    @property
+    @_pooled
+    def rows(self):
+        cursor = self._conn().execute('SELECT data, scanned, scan_time FROM tickets ORDER BY seq')
+        return [self._to_row(record) for record in cursor]
+
+    @_pooled
+    def get(self, ticket_id):
+        record = self._conn().execute(
+            'SELECT data, scanned, scan_time FROM tickets WHERE uuid = ?', (ticket_id,)
+        ).fetchone()
+        return self._to_row(record) if record else None
+
+    @_pooled
+    def page(self, cursor=0, limit=50):
+        records = self._conn().execute(
+            'SELECT seq, data, scanned, scan_time FROM tickets WHERE seq > ? ORDER BY seq LIMIT ?',
+            (max(cursor, 0), limit + 1)
+        ).fetchall()
+        rows = [self._to_row(record[1:]) for record in records[:limit]]
+        return rows, records[limit - 1][0] if len(records) > limit else None
+
+    @_pooled
+    def check_in_many(self, scans):
+        conn = self._conn()
+        with self._write_lock, conn:
+            admitted = []
+            for ticket_id, scan_time in scans:
+                was_admitted = conn.execute(
+                    'UPDATE tickets SET scanned = 1, scan_time = ? WHERE uuid = ? AND scanned = 0',
+                    (scan_time, ticket_id)
+                ).rowcount == 1
+                if was_admitted:
+                    self.counters.record(ticket_id, scan_time)
+                admitted.append(was_admitted)
+
+        return [(self.get(ticket_id), was_admitted) for (ticket_id, _), was_admitted in zip(scans, admitted)]
+
+    @_pooled
+    def assign_ticket_ids(self):
+        conn = self._conn()
+        with conn:
+            updates = []
+            for seq, data in conn.execute('SELECT seq, data FROM tickets ORDER BY seq'):
+                row = json.loads(data)
+                if ensure_ticket_fields(row):
+                    updates.append((row['uuid'], json.dumps(row), seq))
+            conn.executemany('UPDATE tickets SET uuid = ?, data = ? WHERE seq = ?', updates)
+
+            fieldnames = self.fieldnames
+            fieldnames += [name for name in ('uuid', 'scanned', 'scan_time') if name not in fieldnames]
+            self._set_fieldnames(conn, fieldnames)
+            if updates:
+                self._new_ticket_set(conn)
+
+    @_pooled
+    def merge_rows(self, fieldnames, rows):
+        """Merge rows, committing every MERGE_CHUNK_SIZE rows
+
+        Committing per chunk lets check-ins write between chunks instead of
+        waiting for the whole merge.
+        """
+        conn = self._conn()
+        inserted = updated = unchanged = 0
+        with self._merge_lock:
+            with conn:
+                stored_fieldnames = self.fieldnames
+                added = [name for name in fieldnames if name not in stored_fieldnames]
+                if added:
+                    self._set_fieldnames(conn, stored_fieldnames + added)
+                # Only tickets from before the merge are matched by email
+                last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM tickets').fetchone()[0]
+            matcher = EmailMatcher(lambda: (
+                (seq, json.loads(data).get('email')) for seq, data in conn.execute(
+                    'SELECT seq, data FROM tickets WHERE seq <= ? ORDER BY seq', (last_seq,)
+                ).fetchall()
+            ))
+            new_ids = False
+
+            for chunk in _chunked(rows, MERGE_CHUNK_SIZE):
+                with self._write_lock, conn:
+                    chunk_inserted = 0
+                    for row in chunk:
+                        ticket_id = row.get('uuid')
+                        if ticket_id:
+                            record = conn.execute('SELECT seq FROM tickets WHERE uuid = ?', (ticket_id,)).fetchone()
+                            seq = record[0] if record else None
+                            if seq is not None:
+                                matcher.matched.add(seq)
+                        else:
+                            seq = matcher.match(row.get('email'))
+
+                        if seq is None:
+                            scanned = row.get('scanned') == 'True'
+                            self._insert(conn, [(ticket_id or None, scanned, row.get('scan_time') or None, json.dumps(row))])
+                            if ticket_id:
+                                new_ids = True
+                                if scanned:
+                                    self.counters.record(ticket_id, row.get('scan_time') or '')
+                            chunk_inserted += 1
+                            continue
+
+                        current = json.loads(conn.execute('SELECT data FROM tickets WHERE seq = ?', (seq,)).fetchone()[0])
+                        # The ticket's own ID and scan state win over the upload's
+                        changes = {name: value for name, value in row.items()
+                                   if name not in TICKET_COLUMNS and current.get(name, '') != (value or '')}
+                        if changes:
+                            conn.execute('UPDATE tickets SET data = ? WHERE seq = ?',
+                                         (json.dumps(dict(current, **changes)), seq))
+                            updated += 1
+                        else:
+                            unchanged += 1
+                    self.counters.add_tickets(chunk_inserted)
+                    inserted += chunk_inserted
+
+            if new_ids:
+                with conn:
+                    self._new_ticket_set(conn)
+        return inserted, updated, unchanged
+
+    @_pooled
+    def export_csv(self, path):
+        with FILE_IO_SECONDS.time('export'), open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=self.fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(self.rows)
+
+    def close(self):
+        with self._pool_lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def open_store(csv_path, backend='csv', fresh=False):
+    """Open the ticket store for a participant CSV with the chosen backend
+
+    ``fresh`` marks a just-uploaded CSV: the CSV backend discards the old
+    scan journal and the SQLite backend re-imports the file.
+    """
+    if backend == 'sqlite':
+        return SqliteTicketStore(db_path_for(csv_path), csv_path=csv_path, fresh=fresh)
+    if backend == 'csv':
+        return CsvTicketStore(csv_path, fresh=fresh)
+    raise ValueError(f"Unknown ticket store backend: {backend}")